@@ -128,6 +128,12 @@ async def initialize_database(db_manager, config=None):
     );
     """
 
+    # contacts are picked for syncing and expiry by age
+    mc_chat_contacts_last_seen_index = """
+    CREATE INDEX IF NOT EXISTS idx_mc_chat_contacts_last_seen
+        ON mc_chat_contacts (last_seen);
+    """
+
     # all tables to be initialized
     tables = [
         user_table,
@@ -142,6 +148,7 @@ async def initialize_database(db_manager, config=None):
         mc_adverts_table,
         mc_passwd_cache_table,
         mc_chat_contacts_table,
+        mc_chat_contacts_last_seen_index,
     ]
 
     for sql in tables:
@@ -1,5 +1,6 @@
 import aiosqlite
 import asyncio
+from contextlib import asynccontextmanager
 import logging
 import sqlite3
 import threading
@@ -9,6 +10,15 @@ from citadel.logging_lock import AsyncLoggingLock, LoggingLock
 
 log = logging.getLogger(__name__)
 
+# accepted values for the journal_mode and synchronous settings; PRAGMA
+# values can't be bound as parameters, so they're checked against these
+_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SYNC_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+# prepared statements sqlite3 keeps per connection (its default is 128).
+# the BBS has around a hundred distinct queries, plus the variants built
+# for IN (...) lists, so leave room for all of them
+_CACHED_STATEMENTS = 256
+
 
 class DatabaseManager:
     _instance = None
@@ -27,6 +37,7 @@ class DatabaseManager:
         self.db_path = config.database['db_path']
         self.conn = None
         self.lock = threading.Lock()
+        self._write_lock = asyncio.Lock()
         self._shutdown_event = asyncio.Event()
 
         self._initialized = True
@@ -35,7 +46,8 @@ class DatabaseManager:
     async def start(self):
         if self.config.database.get("use_memory", False):
             disk_conn = await aiosqlite.connect(self.db_path)
-            self.conn = await aiosqlite.connect(":memory:")
+            self.conn = await aiosqlite.connect(
+                ":memory:", cached_statements=_CACHED_STATEMENTS)
             await disk_conn.backup(self.conn)
             await disk_conn.close()
             self._persist_task = asyncio.create_task(self._persist_loop())
@@ -43,9 +55,27 @@ class DatabaseManager:
             log.info(
                 f"Database loaded into memory; will save to disk every {seconds}s")
         else:
-            self.conn = await aiosqlite.connect(self.db_path)
+            self.conn = await aiosqlite.connect(
+                self.db_path, cached_statements=_CACHED_STATEMENTS)
+            await self._set_disk_pragmas()
             log.info(f"Database connected (using disk DB file)")
 
+    async def _set_disk_pragmas(self):
+        """Apply the configured journal and sync modes to a disk DB.  WAL
+        with synchronous=NORMAL avoids an fsync pair on every commit."""
+        journal_mode = str(
+            self.config.database.get("journal_mode", "WAL")).upper()
+        synchronous = str(
+            self.config.database.get("synchronous", "NORMAL")).upper()
+        if journal_mode in _JOURNAL_MODES:
+            await self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        else:
+            log.warning(f"Ignoring unknown journal_mode '{journal_mode}'")
+        if synchronous in _SYNC_MODES:
+            await self.conn.execute(f"PRAGMA synchronous = {synchronous}")
+        else:
+            log.warning(f"Ignoring unknown synchronous '{synchronous}'")
+
     async def _persist_loop(self):
         while not self._shutdown_event.is_set():
             seconds = self.config.bbs.get("database_save_interval", 300)
@@ -73,13 +103,37 @@ class DatabaseManager:
         else:
             return await self._process_read(query, params)
 
+    @asynccontextmanager
+    async def transaction(self):
+        """Group several writes under a single commit.  Statements are
+        issued on the yielded connection; they are committed when the
+        block exits, or rolled back if it raises."""
+        async with self._write_lock:
+            try:
+                yield self.conn
+                await self.conn.commit()
+            except sqlite3.OperationalError as e:
+                await self.conn.rollback()
+                log.error(f"SQLite operational error during transaction: {e}")
+                raise RuntimeError("Database write failed. Please try again.")
+            except sqlite3.DatabaseError as e:
+                await self.conn.rollback()
+                log.error(f"SQLite database error: {e}")
+                raise RuntimeError("Database error occurred.")
+            except BaseException:
+                # includes cancellation; the connection is shared, so an
+                # open transaction would be committed by the next write
+                await self.conn.rollback()
+                raise
+
     async def _process_write(self, query: str, params: tuple, callback: Optional[Callable]):
         try:
-            async with self.conn.execute(query, params) as cursor:
-                await self.conn.commit()
-                if callback:
-                    callback(cursor)
-                return cursor.rowcount
+            async with self._write_lock:
+                async with self.conn.execute(query, params) as cursor:
+                    await self.conn.commit()
+                    if callback:
+                        callback(cursor)
+                    return cursor.rowcount
         except sqlite3.OperationalError as e:
             log.error(f"SQLite operational error during write: {e}")
             raise RuntimeError("Database write failed. Please try again.")
@@ -12,7 +12,10 @@ log = logging.getLogger(__name__)
 
 def format_timestamp(config, utc_timestamp):
     if isinstance(utc_timestamp, str):
-        utc_timestamp = dateparse(utc_timestamp)
+        try:
+            utc_timestamp = datetime.fromisoformat(utc_timestamp)
+        except ValueError:
+            utc_timestamp = dateparse(utc_timestamp)
     elif isinstance(utc_timestamp, int):
         utc_timestamp = datetime.fromtimestamp(utc_timestamp)
 
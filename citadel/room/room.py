@@ -61,8 +61,15 @@ class Room:
         self.permission_level = PermissionLevel.USER
         self.next_neighbor = None
         self.prev_neighbor = None
+        self.prompt_suffix = None
         self._loaded = False
 
+    @staticmethod
+    def prompt_for(name: str) -> str:
+        """The line that ends a user's prompt while they're in the
+        named room."""
+        return f"In {name}. What now? (H for help)"
+
     # this must be called on every object after instantiation
     async def load(self, force=False):
         if self._loaded and not force:
@@ -80,6 +87,7 @@ class Room:
         self.permission_level = PermissionLevel(int(result[0][3]))
         self.next_neighbor = result[0][4]
         self.prev_neighbor = result[0][5]
+        self.prompt_suffix = self.prompt_for(self.name)
         self._loaded = True
 
     @classmethod
@@ -8,7 +8,7 @@ from typing import TYPE_CHECKING
 from citadel.config import Config
 from citadel.logging_lock import AsyncLoggingLock, LoggingLock
 from citadel.room.room import SystemRoomIDs
-from citadel.session.state import SessionState
+from citadel.session.state import SessionState, SessionSnapshot
 from citadel.workflows.base import WorkflowState
 from citadel.transport.packets import ToUser
 
@@ -32,6 +32,13 @@ class SessionManager:
 
     def create_session(self, node_id: str = None) -> str:
         """Create a session not yet tied to a user."""
+        with self.lock:
+            session_id, _ = self._add_session(node_id)
+        log.info(f"Provisional session created: {session_id}")
+        return session_id
+
+    def _add_session(self, node_id: str = None) -> tuple[str, SessionState]:
+        """Register a fresh session.  Caller must hold self.lock."""
         session_id = secrets.token_urlsafe(24)
         state = SessionState(
             username=None,
@@ -40,10 +47,28 @@ class SessionManager:
             msg_queue=asyncio.Queue(),
             node_id=node_id
         )
+        self.sessions[session_id] = (state, datetime.now(UTC))
+        return session_id, state
+
+    def snapshot(self, session_id: str) -> SessionSnapshot | None:
+        """Fetch a session's state and workflow in one go."""
         with self.lock:
-            self.sessions[session_id] = (state, datetime.now(UTC))
+            data = self.sessions.get(session_id)
+        if not data:
+            return None
+        state, _ = data
+        return SessionSnapshot(session_id, state, state.workflow)
+
+    def snapshot_for_node(self, node_id: str) -> SessionSnapshot:
+        """Fetch the session for a node, creating one if the node
+        doesn't have one yet (is_new is set in that case)."""
+        with self.lock:
+            for session_id, (state, _) in self.sessions.items():
+                if state.node_id == node_id:
+                    return SessionSnapshot(session_id, state, state.workflow)
+            session_id, state = self._add_session(node_id)
         log.info(f"Provisional session created: {session_id}")
-        return session_id
+        return SessionSnapshot(session_id, state, is_new=True)
 
     def get_session_state(self, session_id: str) -> SessionState | None:
         with self.lock:
@@ -136,10 +161,25 @@ class SessionManager:
         if not isinstance(message, ToUser):
             message = ToUser(session_id=session_id, text=message)
         state = self.get_session_state(session_id)
-        log.debug(f'adding message to queue: {message}')
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f'adding message to queue: {message}')
         await state.msg_queue.put(message)
         return state.msg_queue.qsize()
 
+    async def send_msgs(self, session_id: str, messages: list) -> int:
+        """ add several messages to the outbound message queue in one go.
+        each message is still queued individually, so a 'stop' can
+        clear whatever hasn't been sent yet.  returns the number of
+        items currently in the outbound queue. """
+        state = self.get_session_state(session_id)
+        log.debug(f'adding {len(messages)} messages to queue')
+        for message in messages:
+            if not isinstance(message, ToUser):
+                message = ToUser(session_id=session_id, text=message)
+            # the queue is unbounded, so this never raises QueueFull
+            state.msg_queue.put_nowait(message)
+        return state.msg_queue.qsize()
+
     async def clear_msg_queue(self, session_id: str) -> int:
         """remove all pending messages from the message queue.  unsent
         messages are discarded."""
@@ -15,3 +15,14 @@ class SessionState:
     logged_in: bool = False
     msg_queue: asyncio.Queue = None
     node_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SessionSnapshot:
+    """A session's id, state and workflow, fetched together so the
+    message path doesn't have to go back to the session manager for
+    each piece."""
+    session_id: str
+    state: SessionState
+    workflow: Optional[WorkflowState] = None
+    is_new: bool = False
@@ -0,0 +1,51 @@
+"""
+MeshCore transport settings.
+
+Reads the transport.meshcore section of config.yaml once into a typed,
+immutable object, so components don't each re-derive it and look keys up
+by string on every use.
+"""
+
+from dataclasses import dataclass, fields
+
+
+@dataclass(frozen=True, slots=True)
+class MeshCoreConfig:
+    """Settings from the transport.meshcore section of config.yaml.
+    Defaults apply to any key that isn't set there."""
+    # connection
+    serial_port: str = "/dev/ttyUSB0"
+    baud_rate: int = 115200
+
+    # radio settings default to US Recommended settings
+    frequency: float = 910.525          # MHz
+    bandwidth: float = 62.5             # kHz
+    spreading_factor: int = 7
+    coding_rate: int = 5
+    tx_power: int = 22                  # dBm
+    name: str = "Mesh-Citadel BBS"
+    multi_acks: bool = True
+
+    # sending
+    max_retries: int = 3
+    max_flood_attempts: int = 3
+    flood_after: int = 2
+    send_timeout: float = 0
+    retry_delay: float = 1.0
+    inter_packet_delay: float = 0.5     # seconds
+    max_packet_size: int = 140
+
+    # message routing
+    prompt_cache_ttl: float = 5         # seconds
+    validation_count_ttl: float = 2     # seconds
+
+    @classmethod
+    def from_config(cls, config) -> "MeshCoreConfig":
+        """Build from the main Config, ignoring keys this class doesn't
+        know about (e.g. the contact_manager subsection)."""
+        mc_config = config.transport.get("meshcore", {})
+        return cls(**{
+            f.name: mc_config[f.name]
+            for f in fields(cls)
+            if f.name in mc_config
+        })
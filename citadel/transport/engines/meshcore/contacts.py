@@ -6,13 +6,43 @@ Memory-optimized for Raspberry Pi Zero.
 """
 
 import asyncio
+from collections import OrderedDict
 import json
 import logging
+import time
 from datetime import datetime, UTC
 from meshcore import EventType
 
+from citadel.transport.engines.meshcore.util import utc_now_str
+
 log = logging.getLogger(__name__)
 
+# stay under SQLite's default limit of 999 bound parameters
+_MAX_SQL_PARAMS = 900
+
+# the queued contact writes, shared by every call so _flush_writes can
+# group matching writes into one executemany and sqlite3 reuses the
+# same prepared statement for them
+_UPSERT_CONTACT_SQL = """
+    INSERT INTO mc_chat_contacts
+    (node_id, public_key, name, node_type, latitude, longitude,
+        first_seen, last_seen, raw_advert_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(node_id) DO UPDATE SET
+        public_key = excluded.public_key,
+        name = excluded.name,
+        node_type = excluded.node_type,
+        latitude = excluded.latitude,
+        longitude = excluded.longitude,
+        last_seen = excluded.last_seen,
+        raw_advert_data = excluded.raw_advert_data
+"""
+_MARK_ADDED_SQL = """
+    UPDATE mc_chat_contacts
+    SET added_manually = TRUE, last_seen = ?
+    WHERE node_id = ?
+"""
+
 
 class ContactManager:
     """Manages chat node contacts with automatic cleanup when approaching storage limits."""
@@ -24,6 +54,30 @@ class ContactManager:
             "meshcore", {}).get("contact_manager", {})
         # Minimal cache: node_id -> name (all entries are chat nodes by definition)
         self._contacts_cache = {}
+        # Contact writes are queued and committed in batches by
+        # advert_writer(), so an advert flood costs one commit per batch
+        # rather than one per advert
+        self._advert_queue: asyncio.Queue = asyncio.Queue()
+        self._batch_ready = asyncio.Event()
+        self._flush_interval = self.config.get('advert_flush_interval', 5)
+        self._batch_size = self.config.get('advert_batch_size', 50)
+        # started by start(), so the queue always has something draining it
+        self._writer_task = None
+        # public_key -> monotonic time last handled.  a single advert can
+        # arrive as both ADVERTISEMENT and NEW_CONTACT, and repeaters
+        # echo adverts, so repeats inside the window are dropped early
+        self._recent_adverts = {}
+        self._advert_window = self.config.get('advert_dedupe_window', 10)
+        # device contact limits; contacts are expired once the device is
+        # within contact_limit_buffer of max_device_contacts
+        self._max_contacts = self.config.get('max_device_contacts', 240)
+        self._contact_buffer = self.config.get('contact_limit_buffer', 10)
+        self._capacity = self._max_contacts - self._contact_buffer
+        # public key -> last_seen for the contacts on the device, oldest
+        # first, so the next one to expire is always at the head.
+        # auto-add is off, so only add_node and delete_node change what's
+        # on the device; None until it's first read
+        self._device_contacts = None
 
     async def start(self):
         """Initialize contact manager and load essential contact info."""
@@ -38,9 +92,19 @@ class ContactManager:
             else:
                 log.info("Disabled meshcore auto-add of contacts")
 
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self.advert_writer())
+
         log.info(
             f"ContactManager started with {len(self._contacts_cache)} cached contacts")
 
+    async def stop(self):
+        """Stop the contact writer, committing any writes still queued."""
+        task, self._writer_task = self._writer_task, None
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
     async def _load_essential_contacts(self):
         """Load only essential contact info into cache."""
         contacts = await self.db.execute(
@@ -54,13 +118,42 @@ class ContactManager:
         log.debug(f"Loaded {len(self._contacts_cache)} contacts into cache")
 
     async def sync_db_to_node(self):
-        """Load only essential contact info into cache."""
+        """Copy every stored contact down to the MC node."""
         log.info("Synchronizing contacts down to MC node")
-        for node_id in self._contacts_cache.keys():
+        # only the most recently seen contacts that will fit; anything
+        # past that would just be expired again
+        rows = await self.db.execute(
+            """SELECT node_id, public_key FROM mc_chat_contacts
+               ORDER BY last_seen DESC LIMIT ?""",
+            (max(self._capacity, 0),)
+        )
+        # contacts already on the device don't need another add command,
+        # so their advert data isn't needed either
+        if self._device_contacts is None:
+            await self._load_device_contacts()
+        on_device = self._device_contacts or {}
+        # oldest first, so if the device does fill up it's the most
+        # recently seen contacts that are left on it
+        to_add = [node_id for node_id, public_key in reversed(rows)
+                  if public_key not in on_device]
+        skipped = len(rows) - len(to_add)
+        advert_data = await self._get_columns(to_add, "raw_advert_data")
+
+        synced = 0
+        for node_id in to_add:
+            try:
+                contact_data = json.loads(advert_data.get(node_id))
+            except (json.JSONDecodeError, TypeError) as e:
+                log.error(
+                    f"Failed to parse stored contact data for {node_id}: {e}")
+                continue
             log.debug(f"Syncing {node_id} down to node")
-            await self.add_node(node_id, quiet=True)
+            if await self.add_node(node_id, quiet=True,
+                                   contact_data=contact_data):
+                synced += 1
 
-        log.info(f"Synced {len(self._contacts_cache)} contacts into node")
+        log.info(
+            f"Synced {synced} contacts into node ({skipped} already there)")
 
     def _is_chat_node(self, advert_data: dict) -> bool:
         """Determine if this is a chat node (companion) we want to track."""
@@ -77,6 +170,10 @@ class ContactManager:
                 log.warning("Advert missing public key")
                 return
 
+            if self._seen_recently(public_key):
+                log.debug(f"Ignoring repeat advert from {public_key[:16]}")
+                return
+
             node_id = public_key[:16]
 
             # Query meshcore device for full contact details
@@ -89,7 +186,8 @@ class ContactManager:
                 return
 
             if not self._is_chat_node(contact_details):
-                log.debug(f"Rejecting non-chat node: {contact_details}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(f"Rejecting non-chat node: {contact_details}")
                 return  # Not a chat node, ignore
 
             name = contact_details.get(
@@ -99,14 +197,36 @@ class ContactManager:
 
             self._contacts_cache[node_id] = name
 
-            # Trigger cleanup if we're approaching limits
-            await self._cleanup_if_needed()
-            await self.add_node(node_id)
+            if await self._touch_device_contact(public_key):
+                # the firmware updates contacts it already has from their
+                # adverts, so there's nothing to send to the device
+                log.debug(f"{node_id} is already on the device")
+            else:
+                # Trigger cleanup if we're approaching limits
+                await self._cleanup_if_needed()
+                # the record above may still be queued, so hand the details
+                # over directly instead of reading them back from the DB
+                await self.add_node(node_id, contact_data=contact_details)
 
             log.info(f"Recorded advert: {name} ({node_id})")
         except Exception as e:
             log.exception(f"Unhandled exception in handle_advert: {e}")
 
+    def _seen_recently(self, public_key: str) -> bool:
+        """Record an advert from public_key, returning True if one was
+        already handled within the dedupe window."""
+        now = time.monotonic()
+        seen_at = self._recent_adverts.get(public_key)
+        if seen_at is not None and now - seen_at < self._advert_window:
+            return True
+        if len(self._recent_adverts) > 256:
+            self._recent_adverts = {
+                key: ts for key, ts in self._recent_adverts.items()
+                if now - ts < self._advert_window
+            }
+        self._recent_adverts[public_key] = now
+        return False
+
     async def _get_contact_details(self, public_key: str):
         """Get full contact details from the meshcore device."""
         if not self.meshcore:
@@ -117,7 +237,8 @@ class ContactManager:
         try:
             contact = self.meshcore.get_contact_by_key_prefix(node_id)
             if contact:
-                log.debug(f"Found {node_id} in device: {contact}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(f"Found {node_id} in device: {contact}")
             else:
                 log.debug(f"{node_id} contact details not found in device")
             return contact
@@ -136,15 +257,16 @@ class ContactManager:
                 f"Unable to get all contacts from device: {result.payload}")
             return None
 
-        contacts = result.payload
+        contacts = result.payload or {}
 
-        for contact_key, contact_data in contacts.items():
-            if contact_data.get('public_key', contact_key) == public_key:
-                log.debug(
-                    f"Found contact {node_id} by searching: {contact_data}")
-                return contact_data
+        # the contact list is keyed by public key, so look it up directly
+        # rather than scanning every entry
+        contact_data = contacts.get(public_key)
+        if contact_data:
+            log.debug(f"Found contact {node_id} by key: {contact_data}")
+            return contact_data
 
-        log.debug("No method found to get {node_id} from device")
+        log.debug(f"No method found to get {node_id} from device")
         return None
 
     async def _update_contact_record(self, node_id: str, contact_data: dict):
@@ -155,7 +277,7 @@ class ContactManager:
         node_type = contact_data.get('type', 1)  # usually 1 for chat node
         latitude = contact_data.get('adv_lat', contact_data.get('lat'))
         longitude = contact_data.get('adv_lon', contact_data.get('lon'))
-        now = datetime.now(UTC).isoformat()
+        now = utc_now_str()
 
         try:
             raw_data_json = json.dumps(contact_data)
@@ -163,33 +285,76 @@ class ContactManager:
             log.warning(f"Failed to serialize contact data for {node_id}: {e}")
             raw_data_json = "{}"
 
-        await self.db.execute("""
-            INSERT INTO mc_chat_contacts
-            (node_id, public_key, name, node_type, latitude, longitude,
-                first_seen, last_seen, raw_advert_data)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(node_id) DO UPDATE SET
-                public_key = excluded.public_key,
-                name = excluded.name,
-                node_type = excluded.node_type,
-                latitude = excluded.latitude,
-                longitude = excluded.longitude,
-                last_seen = excluded.last_seen,
-                raw_advert_data = excluded.raw_advert_data
-        """, (node_id, public_key, name, node_type, latitude, longitude, now, now, raw_data_json))
-
-    async def add_node(self, node_id: str, quiet: bool = False) -> bool:
-        """Add a chat node to the meshcore device, expiring oldest if at limit."""
+        await self._queue_write(_UPSERT_CONTACT_SQL, (node_id, public_key, name, node_type, latitude, longitude, now, now, raw_data_json))
+
+    async def _queue_write(self, query: str, params: tuple):
+        """Queue a contact write for the next batch commit."""
+        await self._advert_queue.put((query, params))
+        # advert_writer already holds the first write of the batch it's
+        # waiting on, so the batch is full one short of batch_size here
+        if self._advert_queue.qsize() >= self._batch_size - 1:
+            self._batch_ready.set()
+
+    async def _flush_writes(self, batch: list):
+        """Commit a batch of queued writes in a single transaction.
+        Consecutive writes sharing a query are sent with one executemany,
+        and the original ordering is preserved."""
+        groups = []
+        for query, params in batch:
+            if groups and groups[-1][0] == query:
+                groups[-1][1].append(params)
+            else:
+                groups.append((query, [params]))
+
+        try:
+            async with self.db.transaction() as conn:
+                for query, rows in groups:
+                    await conn.executemany(query, rows)
+            log.debug(f"Committed {len(batch)} queued contact writes")
+        except Exception as e:
+            log.exception(
+                f"Failed to commit {len(batch)} queued contact writes: {e}")
+
+    async def advert_writer(self):
+        """Drain the contact write queue, committing every
+        'advert_flush_interval' seconds or 'advert_batch_size' writes,
+        whichever comes first.  Runs from start() until stop()."""
+        batch = []
+        try:
+            while True:
+                batch.append(await self._advert_queue.get())
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(),
+                                           timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass  # interval elapsed, flush whatever we have
+                self._batch_ready.clear()
+                while not self._advert_queue.empty():
+                    batch.append(self._advert_queue.get_nowait())
+                # only forget the batch once it's written; the writes are
+                # upserts, so repeating them after a cancel is harmless
+                await self._flush_writes(batch)
+                batch = []
+        except asyncio.CancelledError:
+            log.info("advert_writer was cancelled")
+            while not self._advert_queue.empty():
+                batch.append(self._advert_queue.get_nowait())
+            if batch:
+                await self._flush_writes(batch)
+        finally:
+            log.info("advert_writer shutdown complete")
+
+    async def add_node(self, node_id: str, quiet: bool = False,
+                       contact_data: dict = None) -> bool:
+        """Add a chat node to the meshcore device, expiring oldest if at
+        limit.  If contact_data isn't passed in, it's read from the DB."""
         if node_id not in self._contacts_cache:
             log.warning(f"Cannot add unknown node: {node_id}")
             return False
 
         # Check if we're at the contact limit and need to make room
         current_contacts = await self._get_device_contact_count()
-        max_contacts = self.config.get('max_device_contacts', 240)
-        buffer_size = self.config.get('contact_limit_buffer', 10)
-
-        if current_contacts >= (max_contacts - buffer_size):
+        if current_contacts >= self._capacity:
             if not await self._expire_oldest_contact():
                 name = self._contacts_cache[node_id]
                 log.warning(
@@ -200,21 +365,22 @@ class ContactManager:
             log.error("MeshCore not available for adding contact")
             return False
 
-        # Get full contact data from database for adding
-        result = await self.db.execute(
-            "SELECT raw_advert_data FROM mc_chat_contacts WHERE node_id = ?",
-            (node_id,)
-        )
-        if not result:
-            log.error(f"No stored data for node {node_id}, cannot add")
-            return False
+        if not contact_data:
+            # Get full contact data from database for adding
+            result = await self.db.execute(
+                "SELECT raw_advert_data FROM mc_chat_contacts WHERE node_id = ?",
+                (node_id,)
+            )
+            if not result:
+                log.error(f"No stored data for node {node_id}, cannot add")
+                return False
 
-        try:
-            contact_data = json.loads(result[0][0])
-        except (json.JSONDecodeError, TypeError) as e:
-            log.error(
-                f"Failed to parse stored contact data for {node_id}: {e}")
-            return False
+            try:
+                contact_data = json.loads(result[0][0])
+            except (json.JSONDecodeError, TypeError) as e:
+                log.error(
+                    f"Failed to parse stored contact data for {node_id}: {e}")
+                return False
 
         log.debug(f"Preparing to add {node_id} to device contacts")
         try:
@@ -224,12 +390,15 @@ class ContactManager:
             return False
 
         if result and result.type != EventType.ERROR:
-            await self.db.execute(
-                """UPDATE mc_chat_contacts
-                   SET added_manually = TRUE, last_seen = ?
-                   WHERE node_id = ?""",
-                (datetime.now(UTC).isoformat(), node_id)
-            )
+            if self._device_contacts is not None:
+                pubkey = contact_data.get('public_key')
+                if pubkey:
+                    self._device_contacts[pubkey] = datetime.now(UTC)
+                    self._device_contacts.move_to_end(pubkey)
+                else:
+                    self._device_contacts = None
+            await self._queue_write(
+                _MARK_ADDED_SQL, (utc_now_str(), node_id))
             name = self._contacts_cache[node_id]
             if quiet:
                 log.debug(f"Added contact to MC device: {name} ({node_id})")
@@ -237,6 +406,8 @@ class ContactManager:
                 log.info(f"Added contact to MC device: {name} ({node_id})")
             return True
         else:
+            # the device may be fuller than we think; recount next time
+            self._device_contacts = None
             name = self._contacts_cache[node_id]
             log.error(
                 f"Failed to add contact {name}: {result.payload if result else 'No data'}")
@@ -254,6 +425,9 @@ class ContactManager:
             if result:
                 pubkey = result[0][0]
             else:
+                # not one of ours; it may still be on the device
+                pubkey = await self._find_device_pubkey(node_id)
+            if not pubkey:
                 log.warning(f"Unable to remove {node_id}; no pubkey found")
                 return False
 
@@ -264,6 +438,8 @@ class ContactManager:
             return False
 
         if result and result.type != EventType.ERROR:
+            if self._device_contacts is not None:
+                self._device_contacts.pop(pubkey, None)
             log.info(f"Removed contact from MC device: {node_id}")
             return True
         else:
@@ -311,36 +487,89 @@ class ContactManager:
         return {node_id: {'name': name} for node_id, name in self._contacts_cache.items()}
 
     async def _get_device_contact_count(self) -> int:
-        """Get current number of contacts on the device."""
+        """Get current number of contacts on the device, only asking the
+        device if it hasn't been asked yet."""
+        if self._device_contacts is None:
+            await self._load_device_contacts()
+        return len(self._device_contacts or ())
+
+    async def _touch_device_contact(self, public_key: str) -> bool:
+        """Mark public_key as just seen if it's on the device.  Returns
+        False if it isn't (or the device can't be read)."""
+        if self._device_contacts is None:
+            await self._load_device_contacts()
+        if not self._device_contacts or public_key not in self._device_contacts:
+            return False
+        self._device_contacts[public_key] = datetime.now(UTC)
+        self._device_contacts.move_to_end(public_key)
+        return True
+
+    async def _find_device_pubkey(self, node_id: str) -> str | None:
+        """Return the public key of the device contact whose key starts
+        with node_id, reading the device's contact list only if it hasn't
+        been read yet."""
+        if self._device_contacts is None:
+            await self._load_device_contacts()
+        for pubkey in self._device_contacts or ():
+            if pubkey.startswith(node_id):
+                return pubkey
+        return None
+
+    async def _load_device_contacts(self) -> bool:
+        """Read the device's contact list, ordered oldest first by the
+        last_seen times in our database.  Contacts we have no record of
+        are put first, since they're the ones to expire first."""
         if not self.meshcore:
-            return 0
+            return False
 
         try:
             result = await self.meshcore.commands.get_contacts()
         except (OSError, AttributeError) as e:
-            log.error(f"Error getting device contact count: {e}")
-            return 0
+            log.error(f"Error getting device contacts: {e}")
+            return False
 
         if not result:
-            log.warning("No data from contact count request")
-            return 0
+            log.warning("No data from contact list request")
+            return False
 
         if result.type == EventType.ERROR:
             log.warning(f"Unable to get device contact list: {result.payload}")
-            return 0
+            return False
 
-        contacts = result.payload
-        return len(contacts) if contacts else 0
+        # node_id -> public key for everything on the device
+        device_nodes = {}
+        for contact_key, contact_data in (result.payload or {}).items():
+            pubkey = contact_data.get('public_key', contact_key)
+            device_nodes[pubkey[:16]] = pubkey
+
+        last_seen_by_node = await self._get_columns(
+            list(device_nodes), "last_seen")
+
+        now = datetime.now(UTC)
+        unknown, known = [], []
+        for node_id, pubkey in device_nodes.items():
+            if node_id not in last_seen_by_node:
+                unknown.append((pubkey, None))
+                continue
+            try:
+                last_seen = datetime.fromisoformat(last_seen_by_node[node_id])
+            except (ValueError, TypeError):
+                # can't tell how old it is, so don't pick it first
+                last_seen = now
+            if last_seen.tzinfo is None:
+                last_seen = last_seen.replace(tzinfo=UTC)
+            known.append((pubkey, last_seen))
+        known.sort(key=lambda item: item[1])
+
+        self._device_contacts = OrderedDict(unknown + known)
+        return True
 
     async def _cleanup_if_needed(self):
         """Check if cleanup is needed and perform it."""
         current_count = await self._get_device_contact_count()
-        max_contacts = self.config.get('max_device_contacts', 240)
-        buffer_size = self.config.get('contact_limit_buffer', 10)
-
-        if current_count >= (max_contacts - buffer_size):
+        if current_count >= self._capacity:
             log.info(
-                f"Contact cleanup triggered: {current_count}/{max_contacts} contacts")
+                f"Contact cleanup triggered: {current_count}/{self._max_contacts} contacts")
             await self._expire_oldest_contact()
 
     async def _expire_oldest_contact(self) -> bool:
@@ -348,69 +577,55 @@ class ContactManager:
         if not self.meshcore:
             return False
 
-        try:
-            result = await self.meshcore.commands.get_contacts()
-        except (OSError, AttributeError) as e:
-            log.error(f"Error getting device contacts for expiry: {e}")
-            return False
+        if self._device_contacts is None:
+            if not await self._load_device_contacts():
+                return False
 
-        if not result or result.type == EventType.ERROR:
-            log.warning(
-                f"No device contacts found to expire: {result.payload}")
+        if not self._device_contacts:
+            log.warning("No device contacts found to expire")
             return False
 
-        device_contacts = result.payload
-
-        # Find the oldest contact from our database
-        oldest_node_id = None
-        oldest_time = datetime.now(UTC)
-
-        for contact_key, contact_data in device_contacts.items():
-            node_id = contact_data.get('public_key', contact_key)[:16]
-            pubkey = contact_data.get('public_key')
-
-            result = await self.db.execute(
-                "SELECT last_seen FROM mc_chat_contacts WHERE node_id = ?",
-                (node_id,)
-            )
-
-            if result:
-                try:
-                    last_seen = datetime.fromisoformat(result[0][0])
-                except ValueError:
-                    continue
+        oldest_pubkey, oldest_time = next(iter(self._device_contacts.items()))
+        oldest_node_id = oldest_pubkey[:16]
+        contact_name = self._contacts_cache.get(oldest_node_id, "Unknown")
+        if oldest_time:
+            age = f"{(datetime.now(UTC) - oldest_time).days}d old"
+        else:
+            age = "no DB record"
 
-                if last_seen < oldest_time:
-                    oldest_time = last_seen
-                    oldest_node_id = node_id
-            else:
-                # No database record, this is very old
-                oldest_node_id = node_id
-                break
-
-        if oldest_node_id:
-            contact_name = "Unknown"
-            if oldest_node_id in self._contacts_cache:
-                contact_name = self._contacts_cache[oldest_node_id]
-
-            days = (datetime.now(UTC) - oldest_time).days
-            if await self.delete_node(oldest_node_id, pubkey):
-                log.info(
-                    f"Expired oldest contact to make room: {contact_name} ({oldest_node_id}) - {days}d old")
-                return True
-            else:
-                log.error(
-                    f"Failed to expire oldest contact: {contact_name} ({oldest_node_id}) - {days}d old")
-                return False
+        if await self.delete_node(oldest_node_id, oldest_pubkey):
+            log.info(
+                f"Expired oldest contact to make room: {contact_name} ({oldest_node_id}) - {age}")
+            return True
         else:
-            log.warning("Could not identify oldest contact to expire")
+            # the device may not match what we think is on it; reread
+            # it next time
+            self._device_contacts = None
+            log.error(
+                f"Failed to expire oldest contact: {contact_name} ({oldest_node_id}) - {age}")
             return False
 
+    async def _get_columns(self, node_ids: list, column: str) -> dict:
+        """Return node_id -> column for those of node_ids in the
+        database, in as few queries as SQLite's parameter limit allows.
+        column must be a literal column name, never user input."""
+        values = {}
+        for i in range(0, len(node_ids), _MAX_SQL_PARAMS):
+            chunk = node_ids[i:i + _MAX_SQL_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = await self.db.execute(
+                f"""SELECT node_id, {column} FROM mc_chat_contacts
+                    WHERE node_id IN ({placeholders})""",
+                chunk
+            )
+            values.update(rows)
+        return values
+
     async def get_contact_usage_stats(self) -> dict:
         """Get contact usage statistics."""
         current_count = await self._get_device_contact_count()
-        max_contacts = self.config.get('max_device_contacts', 240)
-        buffer = self.config.get('contact_limit_buffer', 10)
+        max_contacts = self._max_contacts
+        buffer = self._contact_buffer
 
         return {
             'current_contacts': current_count,
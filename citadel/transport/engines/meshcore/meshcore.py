@@ -1,35 +1,48 @@
 import asyncio
+from collections import OrderedDict
 from datetime import datetime, UTC, timedelta
 from dateutil.parser import parse as dateparse
+import functools
 import hashlib
 import json
 import logging
 from meshcore import MeshCore, EventType
 from serial import SerialException
 import time
-import traceback
 from zoneinfo import ZoneInfo
 
 from citadel.auth.permissions import PermissionLevel
 from citadel.commands.processor import CommandProcessor
 from citadel.logging_lock import AsyncLoggingLock
 from citadel.message.manager import format_timestamp
-from citadel.room.room import SystemRoomIDs
+from citadel.room.room import Room, SystemRoomIDs
 from citadel.transport.engines.meshcore.util import MessageDeduplicator, AdvertScheduler, WatchdogFeeder
 from citadel.transport.packets import FromUser, FromUserType, ToUser
 from citadel.transport.parser import TextParser
 from citadel.transport.engines.meshcore.contacts import ContactManager
+from citadel.transport.errors import TransportError
+from citadel.user.user import User
 from citadel.workflows.base import WorkflowState, WorkflowContext
 from citadel.workflows import registry as workflow_registry
 
 log = logging.getLogger(__name__)
 
+# acks nobody has waited for yet (duplicates from multi_acks, or late
+# arrivals) are forgotten after this many seconds, and only this many
+# are kept at once
+_ACK_TTL = 20
+_MAX_UNCLAIMED_ACKS = 256
+
 
 class MeshCoreTransportEngine:
     def __init__(self, session_mgr, config, db, feed_watchdog=None):
         self.session_mgr = session_mgr
         self.config = config
         self.mc_config = config.transport.get("meshcore", {})
+        # read on every packet, so look them up once
+        self._ack_timeout = self.mc_config.get("ack_timeout", 8)
+        self._max_packet_size = self.mc_config.get("max_packet_size", 140)
+        self._inter_packet_delay = self.mc_config.get("inter_packet_delay", 0.5)
         self.db = db
         self.feed_watchdog = feed_watchdog
         self.command_processor = CommandProcessor(config, db, session_mgr)
@@ -44,6 +57,8 @@ class MeshCoreTransportEngine:
         self.scheds = []
         self._event_loop = None
         self._acks = {}
+        # code -> monotonic arrival time for acks in _acks, oldest first
+        self._ack_arrivals = OrderedDict()
 
     # ------------------------------------------------------------
     # process lifecycle controls
@@ -69,8 +84,7 @@ class MeshCoreTransportEngine:
             log.error(f"OS error during connection: {e}")
             raise
         except Exception as e:
-            log.error(f"Unexpected startup error: {e}")
-            traceback.print_exc()
+            log.exception(f"Unexpected startup error: {e}")
             raise
 
     # left off here.  i'm not sure how to actually trigger the WatchdogFeeder's
@@ -111,7 +125,6 @@ class MeshCoreTransportEngine:
         now = int(time.time())
         log.info(f"Setting MeshCore node time to {now}")
         result = await mc.commands.set_time(now)
-        from citadel.transport.manager import TransportError
         if result.type == EventType.ERROR:
             log.warning(f"Unable to sync time: {result.payload}")
 
@@ -174,19 +187,17 @@ class MeshCoreTransportEngine:
             # Test if the method exists by accessing it (don't call it)
             _ = self.meshcore.commands.send_msg_with_retry
 
-            # Create a wrapper function with config pre-applied
-            async def send_with_retry(node_id, chunk):
-                return await self.meshcore.commands.send_msg_with_retry(
-                    node_id,
-                    chunk,
-                    max_attempts=max_attempts,
-                    max_flood_attempts=max_flood_attempts,
-                    flood_after=flood_after,
-                    timeout=send_timeout
-                )
-            self.send_msg = send_with_retry
+            # Bind the retry config once so each packet send only has
+            # to pass the node and message
+            self.send_msg = functools.partial(
+                self.meshcore.commands.send_msg_with_retry,
+                max_attempts=max_attempts,
+                max_flood_attempts=max_flood_attempts,
+                flood_after=flood_after,
+                timeout=send_timeout
+            )
             log.info(
-                f"Using send_msg_with_retry with max_attempts={max_attempts}, ack_timeout={self.mc_config.get('ack_timeout', 8)}s")
+                f"Using send_msg_with_retry with max_attempts={max_attempts}, ack_timeout={self._ack_timeout}s")
 
         except AttributeError:
             # Implement manual retry wrapper
@@ -263,12 +274,17 @@ class MeshCoreTransportEngine:
         if self._running:
             for sched in self.scheds:
                 sched.stop()
-            for task in self.tasks:
+            # cancel everything, then wait for it all together, so
+            # shutdown takes as long as the slowest task, not the sum
+            waits = [*self.tasks, *self.listeners.values()]
+            for task in waits:
                 task.cancel()
-                await task
-            for listener in self.listeners.values():
-                listener.cancel()
-                await listener
+            results = await asyncio.gather(*waits, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    log.warning(f"Exception during task shutdown: {result}")
+            if self.contact_manager:
+                await self.contact_manager.stop()
             for sub in self.subs:
                 self.meshcore.unsubscribe(sub)
             if self.meshcore:
@@ -298,14 +314,10 @@ class MeshCoreTransportEngine:
                 text = message.text
         else:
             text = message
-        # Get configured packet size (calculated from MeshCore packet structure)
-        max_packet_length = self.mc_config.get("max_packet_size", 140)
-
-        chunks = self._chunk_message(text, max_packet_length)
-        inter_packet_delay = self.mc_config.get("inter_packet_delay", 0.5)
+        chunks = self._chunk_message(text, self._max_packet_size)
         for chunk in chunks:
             sent = await self._send_packet(username, node_id, chunk)
-            await asyncio.sleep(inter_packet_delay)
+            await asyncio.sleep(self._inter_packet_delay)
         return sent
 
     # ------------------------------------------------------------
@@ -313,7 +325,10 @@ class MeshCoreTransportEngine:
     # ------------------------------------------------------------
 
     def format_message(self, message) -> str:
-        utc_timestamp = dateparse(message.timestamp)
+        try:
+            utc_timestamp = datetime.fromisoformat(message.timestamp)
+        except ValueError:
+            utc_timestamp = dateparse(message.timestamp)
         timestamp = format_timestamp(self.config, utc_timestamp)
         to_str = ""
         if message.recipient:
@@ -341,16 +356,19 @@ class MeshCoreTransportEngine:
                 f"Failed to send '{chunk[:50]}...' to {username} at {node_id}")
             return False
 
-        # Wait for ACK with the configured timeout
+        # Wait for ACK with the configured timeout.  ACK events carry
+        # their code as a hex string, so the expected bytes have to be
+        # converted to match.
         exp_ack = result.payload["expected_ack"].hex()
-        # Increased from 5 to 8 seconds
-        ack_timeout = self.mc_config.get("ack_timeout", 8)
-        log.debug(f"Waiting for ACK {exp_ack} with timeout {ack_timeout}s")
+        ack_timeout = self._ack_timeout
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Waiting for ACK {exp_ack} with timeout {ack_timeout}s")
 
         ack = await self.get_ack(exp_ack, ack_timeout)
 
         if ack:
-            log.debug(f"✅ ACK received for packet to {node_id}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"✅ ACK received for packet to {node_id}")
             return True
 
         # Log ACK timeout for debugging (this is normal in mesh communication)
@@ -365,7 +383,6 @@ class MeshCoreTransportEngine:
             if isinstance(message, list):
                 log.error(f"Don't know how to split '{message}'")
                 return ["Oops, check the log"]
-            words = message.split(" ")
         else:
             return ""
 
@@ -374,21 +391,21 @@ class MeshCoreTransportEngine:
             max_packet_length -= len('[xx/xx]')
         else:
             max_packet_length -= len('[x/x]')
+
+        # slice at the last space that fits rather than splitting into
+        # words and joining them back up
         chunks = []
-        chunk = []
-        chunk_size = 0
-        for word in words:
-            wordlen = len(word)
-            if chunk_size + wordlen + 1 < max_packet_length:
-                chunk.append(word)
-                chunk_size += wordlen + 1
+        start = 0
+        end = len(message)
+        while end - start > max_packet_length:
+            brk = message.rfind(' ', start, start + max_packet_length + 1)
+            if brk > start:
+                chunks.append(message[start:brk])
+                start = brk + 1
             else:
-                chunks.append(" ".join(chunk))
-                chunk = [word]
-                chunk_size = wordlen + 1
-
-        if len(chunk) > 0:
-            chunks.append(" ".join(chunk))
+                chunks.append(message[start:start + max_packet_length])
+                start += max_packet_length
+        chunks.append(message[start:])
 
         if approx_chunks > 1:
             len_chunks = len(chunks)
@@ -399,15 +416,16 @@ class MeshCoreTransportEngine:
     async def get_ack(self, code: str, timeout: int = 10) -> bool:
         """Await this function to see if a named ack has been received.
         Returns True or False."""
-        i = 0
-        while True:
-            if i > timeout:
-                return False
-            if code in self._acks:
-                del self._acks[code]
-                return True
-            await asyncio.sleep(1)
-            i += 1
+        # the ack may already be in, in which case the event is set
+        event = self._acks.setdefault(code, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._acks.pop(code, None)
+            self._ack_arrivals.pop(code, None)
 
     # ------------------------------------------------------------
     # bbs event handlers
@@ -430,11 +448,16 @@ class MeshCoreTransportEngine:
 
                     log.debug(f'Waiting for BBS msgs for {session_id}')
                     message = await state.msg_queue.get()
-                    if isinstance(message, list):
-                        log.debug('BBS message is a LIST')
-                    else:
-                        log.debug('BBS message is NOT a list')
-                    log.debug(f'Received BBS msg for {session_id}: {message}')
+                    if log.isEnabledFor(logging.DEBUG):
+                        if isinstance(message, list):
+                            log.debug('BBS message is a LIST')
+                        else:
+                            log.debug('BBS message is NOT a list')
+                        log.debug(f'Received BBS msg for {session_id}: {message}')
+
+                    # pause the bbs just a moment before sending, so the
+                    # sender's radio has time to turn around
+                    await asyncio.sleep(self._inter_packet_delay)
 
                     if isinstance(message, list):
                         for msg in message:
@@ -523,24 +546,38 @@ class MeshCoreTransportEngine:
         return wrapper
 
     async def _handle_acks(self, event):
-        """Cache received acks in self._acks.  Check for received acks with
-        await self.get_ack()."""
+        """Wake up whoever is waiting on this ack in get_ack(), or keep it
+        for them if they haven't started waiting yet."""
         if hasattr(event, 'payload') and 'code' in event.payload:
             code = event.payload['code']
-            log.debug(f'Received an ACK with code {code}')
-            now = datetime.now(UTC)
-            if code in self._acks:
-                if (now - self._acks[code]).seconds > 20:
-                    self._acks[code] = datetime.now(UTC)
-            else:
-                self._acks[code] = datetime.now(UTC)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f'Received an ACK with code {code}')
+            self._expire_acks()
+            self._acks.setdefault(code, asyncio.Event()).set()
+            self._ack_arrivals.setdefault(code, time.monotonic())
+            if len(self._ack_arrivals) > _MAX_UNCLAIMED_ACKS:
+                stale, _ = self._ack_arrivals.popitem(last=False)
+                self._acks.pop(stale, None)
         else:
-            log.warning(f'Received an ACK without a code: {result.payload}')
+            log.warning(f'Received an ACK without a code: {event}')
+
+    def _expire_acks(self):
+        """Forget received acks that have gone unclaimed for longer than
+        _ACK_TTL.  Arrivals are kept oldest first, so this stops at the
+        first one that's still fresh."""
+        cutoff = time.monotonic() - _ACK_TTL
+        while self._ack_arrivals:
+            code, arrived = next(iter(self._ack_arrivals.items()))
+            if arrived > cutoff:
+                break
+            self._ack_arrivals.popitem(last=False)
+            self._acks.pop(code, None)
 
     async def _handle_mc_message(self, event):
         """Handle incoming messages with comprehensive exception protection."""
         try:
-            log.debug(f"Received message event: {event}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"Received message event: {event}")
             await self._process_mc_message_safe(event)
         except Exception as e:
             log.exception(
@@ -575,6 +612,7 @@ class MeshCoreTransportEngine:
             data = event.payload
             node_id = data['pubkey_prefix']
             text = data['text']
+            msg_timestamp = data['sender_timestamp']
         except (KeyError, AttributeError, TypeError) as e:
             log.error(
                 f"Malformed message event - missing required fields: {e}")
@@ -582,7 +620,7 @@ class MeshCoreTransportEngine:
 
         # Check for duplicates with error handling
         try:
-            if await self.dedupe.is_duplicate(node_id, text):
+            if self.dedupe.is_duplicate(node_id, msg_timestamp, text):
                 log.debug(f'Duplicate message from {node_id}, skipping')
                 return
         except Exception as e:
@@ -625,19 +663,9 @@ class MeshCoreTransportEngine:
                 if is_new_session:
                     # This is a reconnection after timeout - send welcome back message
                     welcome_msg = f"Welcome back, {username}! You've been automatically logged in."
-                    welcome_msg = await self.insert_prompt(session_id, welcome_msg)
-
-                    inter_packet_delay = self.mc_config.get(
-                        "inter_packet_delay", 0.5)
-                    await asyncio.sleep(inter_packet_delay)
-                    success = await self.send_to_node(
-                        node_id,
-                        username,
-                        welcome_msg
-                    )
-                    if not success:
-                        log.warning("No ACK when sending welcome back msg")
-                        self.disconnect(session_id)
+                    welcome_msg = await self.insert_prompt(
+                        session_id, welcome_msg, in_workflow=False)
+                    await self.session_mgr.send_msg(session_id, welcome_msg)
 
                     # For welcome back, we send them to the lobby with a prompt
                     # Any text they sent is ignored - this was just to reconnect
@@ -665,32 +693,25 @@ class MeshCoreTransportEngine:
                 )
                 if not success:
                     log.warning(f"No ACK sending auth error msg to {username}")
-                    self.disconnect(session_id)
-            except:
-                pass
+                    await self.disconnect(session_id)
+            except Exception as e:
+                log.warning(
+                    f"Couldn't send auth error notice to {node_id}: {e}")
             return
 
         # Command processing and response
         try:
             touser = await self.command_processor.process(packet)
 
-            # pause the bbs just a moment before sending the command response
-            inter_packet_delay = self.mc_config.get("inter_packet_delay", 0.5)
-            await asyncio.sleep(inter_packet_delay)
-
+            # hand the response to the session's BBS listener, which paces
+            # the packets out; this coroutine is then free for other nodes
             if isinstance(touser, list):
-                last_msg = len(touser) - 1
-                for i, msg in enumerate(touser):
-                    if i == last_msg:
-                        msg = await self.insert_prompt(session_id, msg)
-                    success = await self.send_to_node(node_id, username, msg)
-                    if not success:
-                        self.disconnect(session_id)
+                if touser:
+                    touser[-1] = await self.insert_prompt(session_id, touser[-1])
+                await self.session_mgr.send_msgs(session_id, touser)
             else:
                 touser = await self.insert_prompt(session_id, touser)
-                success = await self.send_to_node(node_id, username, touser)
-                if not success:
-                    self.disconnect(session_id)
+                await self.session_mgr.send_msg(session_id, touser)
 
         except Exception as e:
             log.exception(f"Command processing/response failed for {node_id}")
@@ -698,9 +719,10 @@ class MeshCoreTransportEngine:
                 msg = "Command processing error. Please try again."
                 success = await self.send_to_node(node_id, username, msg)
                 if not success:
-                    self.disconnect(session_id)
-            except:
-                pass
+                    await self.disconnect(session_id)
+            except Exception as e:
+                log.warning(
+                    f"Couldn't send command error notice to {node_id}: {e}")
 
     # ------------------------------------------------------------
     # other helper methods
@@ -779,7 +801,8 @@ class MeshCoreTransportEngine:
             ON CONFLICT(node_id) DO UPDATE SET
                 last_pw_use = excluded.last_pw_use
         """
-        log.debug(f"Updating MeshCore password cache for {username}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Updating MeshCore password cache for {username}")
 
         now = datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S')
         await self.db.execute(query, (node_id, now))
@@ -802,8 +825,6 @@ class MeshCoreTransportEngine:
         # cancel in-progress workflows
         workflow_state = self.session_mgr.get_workflow(session_id)
         if workflow_state:
-            from citadel.workflows import registry as workflow_registry
-
             # Call cleanup on the workflow if it has one
             handler = workflow_registry.get(workflow_state.kind)
             if handler and hasattr(handler, 'cleanup'):
@@ -894,8 +915,13 @@ class MeshCoreTransportEngine:
             log.debug(
                 f"No BBS listener found for session {session_id} during cleanup")
 
-    async def insert_prompt(self, session_id, touser):
-        if self.session_mgr.get_workflow(session_id):
+    async def insert_prompt(self, session_id, touser, *, in_workflow=None):
+        """Add the prompt and notifications to a response.  Callers that
+        already know whether the session is in a workflow can pass
+        in_workflow to skip looking it up again."""
+        if in_workflow is None:
+            in_workflow = bool(self.session_mgr.get_workflow(session_id))
+        if in_workflow:
             return touser
 
         session_state = self.session_mgr.get_session_state(session_id)
@@ -904,7 +930,6 @@ class MeshCoreTransportEngine:
             prompt = ["What now? (H for help)"]
         else:
             # sort out notifications. first, pending validations
-            from citadel.user.user import User
             user = User(self.db, session_state.username)
             await user.load()
             query = "SELECT COUNT(*) FROM pending_validations"
@@ -920,7 +945,6 @@ class MeshCoreTransportEngine:
                 prompt.append(f"* There {isword} {count} {vword} to review")
 
             # next, notify of new mail
-            from citadel.room.room import Room
             mail = Room(self.db, self.config, SystemRoomIDs.MAIL_ID)
             await mail.load()
             has_mail = await mail.has_unread_messages(session_state.username)
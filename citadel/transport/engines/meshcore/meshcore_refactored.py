@@ -7,17 +7,19 @@ rather than implementation details.
 """
 
 import asyncio
+import functools
 from datetime import datetime, UTC, timedelta
 import logging
 from meshcore import MeshCore, EventType
 from serial import SerialException
 import time
-import traceback
 
 from citadel.commands.processor import CommandProcessor
 from citadel.transport.engines.meshcore.util import MessageDeduplicator, AdvertScheduler, WatchdogFeeder
 from citadel.transport.parser import TextParser
+from citadel.transport.engines.meshcore.config import MeshCoreConfig
 from citadel.transport.engines.meshcore.contacts import ContactManager
+from citadel.transport.errors import TransportError
 from citadel.workflows.base import WorkflowState, WorkflowContext
 from citadel.workflows import registry as workflow_registry
 
@@ -30,6 +32,25 @@ from citadel.transport.engines.meshcore.session_coordinator import SessionCoordi
 log = logging.getLogger(__name__)
 
 
+class _SafeHandler:
+    """Exception protection for an event handler, so a crash in one
+    handler can't break its MeshCore subscription.  Subscribe with the
+    bound `run` method: MeshCore checks for a coroutine function to
+    decide whether to await the callback, which a callable instance
+    wouldn't pass."""
+    __slots__ = ('_handler', '_name')
+
+    def __init__(self, handler):
+        self._handler = handler
+        self._name = handler.__name__
+
+    async def run(self, *args, **kwargs):
+        try:
+            await self._handler(*args, **kwargs)
+        except Exception as e:
+            log.exception(f"Handler {self._name} crashed: {e}")
+
+
 class MeshCoreTransportEngine:
     """Orchestrates MeshCore transport components with clean separation of concerns."""
 
@@ -42,6 +63,7 @@ class MeshCoreTransportEngine:
 
         # MeshCore configuration
         self.mc_config = config.transport.get("meshcore", {})
+        self.settings = MeshCoreConfig.from_config(config)
 
         # Core MeshCore objects
         self.meshcore = None
@@ -49,7 +71,7 @@ class MeshCoreTransportEngine:
 
         # Process lifecycle
         self._running = False
-        self.tasks = []
+        self.tasks = {}  # name -> asyncio.Task
         self.subs = []
         self.scheds = []
         self._event_loop = None
@@ -81,17 +103,19 @@ class MeshCoreTransportEngine:
 
             # Initialize protocol handler (now handles send method setup internally)
             self.protocol_handler = ProtocolHandler(
-                self.config, self.db, self.meshcore)
+                self.config, self.db, self.meshcore, self.settings)
 
             # Initialize message router with all dependencies
             self.message_router = MessageRouter(
                 self.config, self.db, self.session_mgr, self.node_auth,
-                self.dedupe, self.text_parser, self.command_processor
+                self.dedupe, self.text_parser, self.command_processor,
+                self.settings
             )
 
             # Initialize session coordinator
             self.session_coordinator = SessionCoordinator(
-                self.config, self.session_mgr, self._create_monitored_task
+                self.config, self.session_mgr,
+                self._create_task_inloop, self._schedule_threadsafe
             )
 
             # Wire up the callbacks between components
@@ -120,8 +144,7 @@ class MeshCoreTransportEngine:
             log.error(f"OS error during connection: {e}")
             raise
         except Exception as e:
-            log.error(f"Unexpected startup error: {e}")
-            traceback.print_exc()
+            log.exception(f"Unexpected startup error: {e}")
             raise
 
     def _wire_component_callbacks(self):
@@ -144,39 +167,31 @@ class MeshCoreTransportEngine:
         """Start the overall engine watchdog feeder system."""
         scheduler = WatchdogFeeder(self.config, self.feed_watchdog)
         self.scheds.append(scheduler)
-        self.tasks.append(
-            self._create_monitored_task(
-                scheduler.start_feeder(),
-                f"watchdog_feeder_{len(self.scheds)}"
-            )
-        )
+        self._start_task(
+            scheduler.start_feeder(), f"watchdog_feeder_{len(self.scheds)}")
         log.info("Started watchdog feeder system")
 
     async def start_dedupe(self):
         self.dedupe = MessageDeduplicator()
-        self.tasks.append(
-            self._create_monitored_task(
-                self.dedupe.clear_expired(),
-                f"dedupe_cleaner_{len(self.scheds)}"
-            )
-        )
+        self._start_task(
+            self.dedupe.clear_expired(), f"dedupe_cleaner_{len(self.scheds)}")
         log.info("Started message deduplication system")
 
     async def start_meshcore(self):
         """Initialize and start the MeshCore connection."""
-        mc_config = self.mc_config
+        settings = self.settings
 
-        serial_port = mc_config.get("serial_port", "/dev/ttyUSB0")
-        baud_rate = mc_config.get("baud_rate", 115200)
+        serial_port = settings.serial_port
+        baud_rate = settings.baud_rate
 
         # Radio settings default to US Recommended settings, if not otherwise set in config
-        frequency = mc_config.get("frequency", 910.525)
-        bandwidth = mc_config.get("bandwidth", 62.5)
-        spreading_factor = mc_config.get("spreading_factor", 7)
-        coding_rate = mc_config.get("coding_rate", 5)
-        tx_power = mc_config.get("tx_power", 22)
-        node_name = mc_config.get("name", "Mesh-Citadel BBS")
-        multi_acks = mc_config.get("multi_acks", True)
+        frequency = settings.frequency
+        bandwidth = settings.bandwidth
+        spreading_factor = settings.spreading_factor
+        coding_rate = settings.coding_rate
+        tx_power = settings.tx_power
+        node_name = settings.name
+        multi_acks = settings.multi_acks
 
         log.info(f"Connecting MeshCore transport at {serial_port}")
         debug = False
@@ -188,45 +203,36 @@ class MeshCoreTransportEngine:
         now = int(time.time())
         log.info(f"Setting MeshCore node time to {now}")
         result = await mc.commands.set_time(now)
-        from citadel.transport.manager import TransportError
         if result.type == EventType.ERROR:
             log.warning(f"Unable to sync time: {result.payload}")
             log.warning("Consider rebooting node (non-critical)")
 
-        # Configure radio parameters
+        # Configure the node.  The device answers each of these with a
+        # bare OK/ERROR that isn't tied to the command that caused it, so
+        # they can't be pipelined or gathered: a response could be matched
+        # to the wrong command.  Run them back to back instead.
         log.info(f"Setting MeshCore frequency to {frequency} MHz")
         log.info(f"Setting MeshCore bandwidth to {bandwidth} kHz")
         log.info(f"Setting MeshCore spreading factor to {spreading_factor}")
         log.info(f"Setting MeshCore coding rate to {coding_rate}")
-        result = await mc.commands.set_radio(
-            frequency,
-            bandwidth,
-            spreading_factor,
-            coding_rate
-        )
-        if result.type == EventType.ERROR:
-            raise TransportError(
-                f"Unable to set radio parameters: {result.payload}")
-
-        # Set TX power
         log.info(f"Setting MeshCore TX power to {tx_power} dBm")
-        result = await mc.commands.set_tx_power(tx_power)
-        if result.type == EventType.ERROR:
-            raise TransportError(f"Unable to set TX power: {result.payload}")
-
-        # Set node name
         log.info(f"Setting MeshCore node name to '{node_name}'")
-        result = await mc.commands.set_name(node_name)
-        if result.type == EventType.ERROR:
-            raise TransportError(f"Unable to set node name: {result.payload}")
-
-        # Configure multi-acks if enabled
+        setup_steps = [
+            ("radio parameters", functools.partial(
+                mc.commands.set_radio,
+                frequency, bandwidth, spreading_factor, coding_rate)),
+            ("TX power", functools.partial(mc.commands.set_tx_power, tx_power)),
+            ("node name", functools.partial(mc.commands.set_name, node_name)),
+        ]
         if multi_acks:
             log.info(f"Setting MeshCore multi-acks to '{multi_acks}'")
-            result = await mc.commands.set_multi_acks(multi_acks)
+            setup_steps.append(("multi-acks", functools.partial(
+                mc.commands.set_multi_acks, multi_acks)))
+
+        for desc, step in setup_steps:
+            result = await step()
             if result.type == EventType.ERROR:
-                raise TransportError(
-                    f"Unable to set multi-acks: {result.payload}")
+                raise TransportError(f"Unable to set {desc}: {result.payload}")
 
         # Ensure contacts
         log.info("Ensuring contacts")
@@ -238,12 +244,8 @@ class MeshCoreTransportEngine:
         # Set up adverts, one right now, then every N hours (config.yaml)
         scheduler = AdvertScheduler(self.config, mc)
         self.scheds.append(scheduler)
-        self.tasks.append(
-            self._create_monitored_task(
-                scheduler.interval_advert(),
-                f"advert_scheduler_{len(self.scheds)}"
-            )
-        )
+        self._start_task(
+            scheduler.interval_advert(), f"advert_scheduler_{len(self.scheds)}")
 
         self.meshcore = mc
 
@@ -260,18 +262,22 @@ class MeshCoreTransportEngine:
         for sched in self.scheds:
             sched.stop()
 
-        # Cancel all tasks
-        from citadel.transport.manager import TransportError
-        for task in self.tasks:
+        # Cancel all tasks, then wait for them together with the session
+        # coordinator's BBS listeners so shutdown is bounded by the
+        # slowest task rather than the sum of them all
+        for task in self.tasks.values():
             task.cancel()
-            try:
-                await task
-            except (asyncio.CancelledError, TransportError):
-                pass
-
-        # Shutdown session coordinator (cleans up BBS listeners)
+        waits = [*self.tasks.values()]
         if self.session_coordinator:
-            await self.session_coordinator.shutdown()
+            waits.append(self.session_coordinator.shutdown())
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning(f"Exception during task shutdown: {result}")
+
+        # Commit any contact writes still queued
+        if self.contact_manager:
+            await self.contact_manager.stop()
 
         # Unsubscribe from events
         for sub in self.subs:
@@ -302,20 +308,16 @@ class MeshCoreTransportEngine:
             # Message handling - delegated to message router
             self.subs.append(self.meshcore.subscribe(
                 EventType.CONTACT_MSG_RECV,
-                self.safe_handler(self.message_router.handle_mc_message)
+                self.safe_handler(self._handle_contact_msg)
             ))
 
-            # Advertisement handling - delegated to contact manager
-            self.subs.append(self.meshcore.subscribe(
-                EventType.ADVERTISEMENT,
-                self.safe_handler(self.contact_manager.handle_advert)
-            ))
-
-            # New contact handling - delegated to contact manager
-            self.subs.append(self.meshcore.subscribe(
-                EventType.NEW_CONTACT,
-                self.safe_handler(self.contact_manager.handle_advert)
-            ))
+            # Advertisement and new contact handling - delegated to
+            # contact manager.  subscribe() takes one event type at a
+            # time, so both subscriptions share a single wrapper.
+            advert_handler = self.safe_handler(self.contact_manager.handle_advert)
+            for event_type in (EventType.ADVERTISEMENT, EventType.NEW_CONTACT):
+                self.subs.append(self.meshcore.subscribe(
+                    event_type, advert_handler))
 
             task = await self.meshcore.start_auto_message_fetching()
             log.debug("Event subscriptions registered")
@@ -323,14 +325,17 @@ class MeshCoreTransportEngine:
             log.error(f"Failed to register handlers: {e}")
             raise
 
+    async def _handle_contact_msg(self, event):
+        """Note when the sending node was heard from, so the reply waits
+        for its radio to turn around, then route the message."""
+        payload = getattr(event, 'payload', None)
+        if isinstance(payload, dict) and 'pubkey_prefix' in payload:
+            self.protocol_handler.note_received(payload['pubkey_prefix'])
+        await self.message_router.handle_mc_message(event)
+
     def safe_handler(self, handler):
         """Wrap handlers with exception protection."""
-        async def wrapper(*args, **kwargs):
-            try:
-                await handler(*args, **kwargs)
-            except Exception as e:
-                log.exception(f"Handler {handler.__name__} crashed: {e}")
-        return wrapper
+        return _SafeHandler(handler).run
 
     # ------------------------------------------------------------
     # Session management integration
@@ -404,42 +409,50 @@ class MeshCoreTransportEngine:
                 await self.protocol_handler.send_to_node(
                     node_id, "user", "Login system error. Please try again later."
                 )
-            except:
-                pass
+            except Exception as e:
+                log.warning(
+                    f"Couldn't send login error notice to {node_id}: {e}")
 
     # ------------------------------------------------------------
     # Task management utilities
     # ------------------------------------------------------------
 
-    def _create_monitored_task(self, coro, name="unnamed"):
-        """Create a task with exception monitoring (matches original implementation)."""
-        try:
-            loop = asyncio.get_running_loop()
-            task = loop.create_task(coro)
-            task.add_done_callback(
-                lambda t: self._handle_task_exception(t, name))
+    def _start_task(self, coro, name: str):
+        """Start one of the engine's own long-running tasks, to be
+        cancelled when the engine stops."""
+        self.tasks[name] = self._create_task_inloop(coro, name)
+
+    def _create_task_inloop(self, coro, name="unnamed"):
+        """Create a monitored task.  Must be called from the event loop."""
+        task = asyncio.get_running_loop().create_task(coro)
+        task.add_done_callback(
+            lambda t: self._handle_task_exception(t, name))
+        if log.isEnabledFor(logging.DEBUG):
             log.debug(f"Created async task for {name}")
-            return task
-        except RuntimeError:
-            # in a thread — use stored event loop for thread-safe execution
-            if self._event_loop is None:
-                log.error(
-                    f"Cannot run {name} threadsafe: no stored event loop")
-                return None
-
-            log.debug(f"Running {name} threadsafe using stored event loop")
-            future = asyncio.run_coroutine_threadsafe(coro, self._event_loop)
-
-            # Attach a callback to handle exceptions
-            def on_done(fut):
-                try:
-                    fut.result()
-                except Exception as e:
-                    self._handle_task_exception(fut, name)
-            future.add_done_callback(on_done)
-            log.debug(
-                f"Successfully scheduled {name} for threadsafe execution")
-            return future
+        return task
+
+    def _schedule_threadsafe(self, coro, name="unnamed"):
+        """Schedule a monitored coroutine on the engine's event loop from
+        another thread."""
+        if self._event_loop is None:
+            log.error(
+                f"Cannot run {name} threadsafe: no stored event loop")
+            coro.close()
+            return None
+
+        log.debug(f"Running {name} threadsafe using stored event loop")
+        future = asyncio.run_coroutine_threadsafe(coro, self._event_loop)
+
+        # Attach a callback to handle exceptions
+        def on_done(fut):
+            try:
+                fut.result()
+            except Exception as e:
+                self._handle_task_exception(fut, name)
+        future.add_done_callback(on_done)
+        log.debug(
+            f"Successfully scheduled {name} for threadsafe execution")
+        return future
 
     def _handle_task_exception(self, task, name: str):
         """Handle exceptions from fire-and-forget tasks (asyncio.Task
@@ -7,19 +7,30 @@ and command processing. Extracted from the main transport engine for better sepa
 
 import asyncio
 import logging
+import time
 from typing import Callable, Awaitable
 
-from citadel.transport.packets import FromUser, FromUserType, ToUser
+from citadel.transport.packets import FromUser, FromUserType, MessageBatch, ToUser
 from citadel.auth.permissions import PermissionLevel
-from citadel.room.room import SystemRoomIDs
+from citadel.room.room import Room, SystemRoomIDs
+from citadel.transport.engines.meshcore.config import MeshCoreConfig
+from citadel.user.user import User
 
 log = logging.getLogger(__name__)
 
+_NO_ROOM_PROMPT = "What now? (H for help)"
+_UNREAD_MAIL_NOTICE = "* You have unread mail"
+# (noun, verb) for one pending validation, and for several
+_VALIDATION_WORDS = (("validation", "is"), ("validations", "are"))
+# workflows that add to or clear the pending validations queue
+_VALIDATION_WORKFLOWS = frozenset(("register_user", "validate_users"))
+
 
 class MessageRouter:
     """Routes incoming MeshCore messages through the processing pipeline."""
 
-    def __init__(self, config, db, session_mgr, node_auth, dedupe, text_parser, command_processor):
+    def __init__(self, config, db, session_mgr, node_auth, dedupe, text_parser, command_processor,
+                 settings: MeshCoreConfig = None):
         self.config = config
         self.db = db
         self.session_mgr = session_mgr
@@ -27,8 +38,7 @@ class MessageRouter:
         self.dedupe = dedupe
         self.text_parser = text_parser
         self.command_processor = command_processor
-        # Derive mc_config from main config
-        self.mc_config = config.transport.get("meshcore", {})
+        self.settings = settings or MeshCoreConfig.from_config(config)
 
         # Callbacks set by parent
         self._send_to_node_func = None
@@ -36,6 +46,23 @@ class MessageRouter:
         self._start_bbs_listener_func = None
         self._start_login_workflow_func = None
 
+        # Per-session prompt text (validation count, unread mail, room
+        # name), rebuilt once it's older than the TTL
+        self._prompt_cache = {}
+        self._prompt_cache_ttl = self.settings.prompt_cache_ttl
+
+        # Single-entry cache for the room prompt line; most prompts in a
+        # row are for the same room, so a dict isn't needed.  It expires
+        # with the prompt cache TTL so a renamed room shows up
+        self._room_cache_id = None
+        self._room_cache_prompt = None
+        self._room_cache_at = 0.0
+
+        # (monotonic time fetched, count) of pending validations, shared
+        # by every aide's prompt
+        self._pv_count_cache = (0.0, 0)
+        self._pv_ttl = self.settings.validation_count_ttl
+
     def set_callbacks(self, send_to_node_func: Callable, disconnect_func: Callable,
                       start_bbs_listener_func: Callable, start_login_workflow_func: Callable):
         """Set callbacks for communication and workflow management."""
@@ -47,7 +74,8 @@ class MessageRouter:
     async def handle_mc_message(self, event):
         """Handle incoming messages with comprehensive exception protection."""
         try:
-            log.debug(f"Received message event: {event}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"Received message event: {event}")
             await self._process_mc_message_safe(event)
         except Exception as e:
             log.exception(
@@ -86,7 +114,7 @@ class MessageRouter:
 
         # Check for duplicates with error handling
         try:
-            if await self.dedupe.is_duplicate(node_id, msg_timestamp, text):
+            if self.dedupe.is_duplicate(node_id, msg_timestamp, text):
                 log.debug(f'Duplicate message from {node_id}, skipping')
                 return
         except Exception as e:
@@ -95,155 +123,141 @@ class MessageRouter:
 
         # Session management with error handling
         try:
-            session_id = self.session_mgr.get_session_by_node_id(node_id)
-            is_new_session = (session_id is None)
-            if is_new_session:
-                session_id = self.session_mgr.create_session(node_id)
+            snap = self.session_mgr.snapshot_for_node(node_id)
+            session_id = snap.session_id
+            if snap.is_new:
                 await self._start_bbs_listener_func(session_id)
         except Exception as e:
             log.exception(f"Session management failed for {node_id}")
             return  # Can't proceed without session
 
-        # Authentication and workflow processing
-        try:
-            username = await self.node_auth.node_has_password_cache(node_id)
-
-            wf_state = self.session_mgr.get_workflow(session_id)
-
-            if wf_state:
-                packet = FromUser(
-                    session_id=session_id,
-                    payload_type=FromUserType.WORKFLOW_RESPONSE,
-                    payload=text
-                )
-            elif username:
-
-                await self.node_auth.touch_password_cache(username, node_id)
-
-                await self.node_auth.set_cache_username(username, node_id)
+        # Fast path: a node mid-workflow (e.g. logging in) is answering a
+        # prompt, so it goes straight to the command processor without
+        # any password cache lookup or upkeep
+        if snap.workflow:
+            packet = FromUser(
+                session_id=session_id,
+                payload_type=FromUserType.WORKFLOW_RESPONSE,
+                payload=text
+            )
+        else:
+            packet = await self._authenticate(snap, node_id, text)
+            if packet is None:
+                return
 
-                await self.session_mgr.mark_logged_in(session_id, True)
-                self.session_mgr.mark_username(session_id, username)
+        # Command processing and response
+        try:
+            batch = MessageBatch.from_response(
+                await self.command_processor.process(packet))
 
-                # Handle welcome back vs. regular command
-                if is_new_session:
-                    # This is a reconnection after timeout - send welcome back message
-                    welcome_msg = f"Welcome back, {username}! You've been automatically logged in."
-                    welcome_msg = await self.insert_prompt(session_id, welcome_msg)
-                    touser = ToUser(session_id=session_id, text=welcome_msg)
-                    await self.session_mgr.send_msg(session_id, touser)
+            if snap.workflow and snap.workflow.kind in _VALIDATION_WORKFLOWS:
+                self.invalidate_validation_count(session_id)
 
-                    # For welcome back, we send them to the lobby with a prompt
-                    # Any text they sent is ignored - this was just to reconnect
-                    return
+            if not batch.messages:
+                return
 
-                # Process their command normally (existing session)
-                command = self.text_parser.parse_command(text)
+            num_msgs = len(batch.messages)
+            if num_msgs > 1:
+                batch.header = f"Displaying {num_msgs} messages. Send 'stop' to stop."
+            # look at the session once, after the command has run (it may
+            # have started or finished a workflow); workflow output never
+            # gets a prompt, so skip insert_prompt entirely for it
+            snap = self.session_mgr.snapshot(session_id)
+            batch.prompt_on_last = not (snap and snap.workflow)
+            await self.send_batch(session_id, batch, snap)
 
-                packet = FromUser(
-                    session_id=session_id,
-                    payload_type=FromUserType.COMMAND,
-                    payload=command
-                )
-            else:
-                log.info(f'No pw cache found for {node_id}, sending to login')
-                return await self._start_login_workflow_func(session_id, node_id)
         except Exception as e:
-            log.exception(
-                f"Authentication/workflow processing failed for {node_id}")
+            log.exception(f"Command processing/response failed for {node_id}")
             try:
                 error_msg = ToUser(
                     session_id=session_id,
-                    text="Authentication error. Please try again."
+                    text="Command processing error. Please try again."
                 )
                 await self.session_mgr.send_msg(session_id, error_msg)
-            except:
-                pass
-            return
-
-        # Command processing and response
+            except Exception as e:
+                log.warning(
+                    f"Couldn't queue command error notice for {session_id}: {e}")
+
+    async def _authenticate(self, snap, node_id: str, text: str) -> FromUser | None:
+        """Log a node in from its password cache and build the command
+        packet for its message.  Returns None if there's nothing further
+        to process (login started, welcome back sent, or an error)."""
+        session_id = snap.session_id
         try:
-            touser = await self.command_processor.process(packet)
+            username = await self.node_auth.node_has_password_cache(node_id)
+            if not username:
+                log.info(f'No pw cache found for {node_id}, sending to login')
+                await self._start_login_workflow_func(session_id, node_id)
+                return None
 
-            if not touser:
-                return
+            await self.node_auth.refresh_for_login(username, node_id)
 
-            if isinstance(touser, list):
-                last_msg = len(touser) - 1
+            state = snap.state
+            if not (state.logged_in and state.username == username):
+                await self.session_mgr.mark_logged_in(session_id, True)
+                self.session_mgr.mark_username(session_id, username)
 
-                for i, msg in enumerate(touser):
-                    if i == last_msg:
-                        # just send the message
-                        msg = await self.insert_prompt(session_id, msg)
-                    elif i == 0:
-                        await self.send_msg_header(session_id, len(touser))
-                    await self.session_mgr.send_msg(session_id, msg)
-            else:
-                touser = await self.insert_prompt(session_id, touser)
+            # Handle welcome back vs. regular command
+            if snap.is_new:
+                # This is a reconnection after timeout - send welcome back message
+                welcome_msg = f"Welcome back, {username}! You've been automatically logged in."
+                # snap.state is the live session state updated above, and
+                # there's no workflow, so the snapshot is still good here
+                welcome_msg = await self.insert_prompt(
+                    session_id, welcome_msg, snap)
+                touser = ToUser(session_id=session_id, text=welcome_msg)
                 await self.session_mgr.send_msg(session_id, touser)
 
+                # For welcome back, we send them to the lobby with a prompt
+                # Any text they sent is ignored - this was just to reconnect
+                return None
+
+            # Process their command normally (existing session)
+            command = self.text_parser.parse_command(text)
+
+            return FromUser(
+                session_id=session_id,
+                payload_type=FromUserType.COMMAND,
+                payload=command
+            )
         except Exception as e:
-            log.exception(f"Command processing/response failed for {node_id}")
+            log.exception(
+                f"Authentication/workflow processing failed for {node_id}")
             try:
                 error_msg = ToUser(
                     session_id=session_id,
-                    text="Command processing error. Please try again."
+                    text="Authentication error. Please try again."
                 )
                 await self.session_mgr.send_msg(session_id, error_msg)
-            except:
-                pass
-
-    async def send_msg_header(self, session_id, num_msgs):
-        """Inserts a header before the first message, describing
-        how many messages are being sent, and with instructions how to
-        stop the flow."""
-        prompt_str = f"Displaying {num_msgs} messages. Send 'stop' to stop."
-        touser = ToUser(session_id=session_id, text=prompt_str)
-        await self.session_mgr.send_msg(session_id, touser)
-
-    async def insert_prompt(self, session_id: str, touser) -> str:
-        """Insert UI prompts and notifications into responses."""
-        if self.session_mgr.get_workflow(session_id):
+            except Exception as e:
+                log.warning(
+                    f"Couldn't queue auth error notice for {session_id}: {e}")
+            return None
+
+    async def send_batch(self, session_id: str, batch: MessageBatch, snap=None):
+        """Queue a batch's header, messages, and prompt (on the last
+        message) for a session in a single call."""
+        messages = batch.messages
+        if batch.prompt_on_last:
+            messages[-1] = await self.insert_prompt(session_id, messages[-1], snap)
+        if batch.header:
+            messages = [ToUser(session_id=session_id, text=batch.header), *messages]
+        await self.session_mgr.send_msgs(session_id, messages)
+
+    async def insert_prompt(self, session_id: str, touser, snap=None) -> str:
+        """Insert UI prompts and notifications into responses.  Pass a
+        fresh SessionSnapshot as snap to save looking the session up
+        again."""
+        if snap is None:
+            snap = self.session_mgr.snapshot(session_id)
+        if snap and snap.workflow:
             return touser
 
-        session_state = self.session_mgr.get_session_state(session_id)
-        prompt = []
+        session_state = snap.state if snap else None
         if not session_state or not session_state.current_room:
-            prompt = ["What now? (H for help)"]
+            prompt_str = _NO_ROOM_PROMPT
         else:
-            # sort out notifications. first, pending validations
-            from citadel.user.user import User
-            user = User(self.db, session_state.username)
-            await user.load()
-            query = "SELECT COUNT(*) FROM pending_validations"
-            result = await self.db.execute(query, [])
-            count = result[0][0]
-            if count and user.permission_level >= PermissionLevel.AIDE:
-                if count == 1:
-                    vword = "validation"
-                    isword = "is"
-                else:
-                    vword = "validations"
-                    isword = "are"
-                prompt.append(f"* There {isword} {count} {vword} to review")
-
-            # next, notify of new mail
-            from citadel.room.room import Room
-            mail = Room(self.db, self.config, SystemRoomIDs.MAIL_ID)
-            await mail.load()
-            has_mail = await mail.has_unread_messages(session_state.username)
-            if has_mail:
-                prompt.append("* You have unread mail")
-
-            # Get room name
-            try:
-                room = Room(self.db, self.config, session_state.current_room)
-                await room.load()
-                room_name = room.name
-            except Exception:
-                room_name = f"Room {session_state.current_room}"
-            prompt.append(f"In {room_name}. What now? (H for help)")
-        prompt_str = "\n".join(prompt)
+            prompt_str = await self._get_prompt(session_id, session_state)
 
         if isinstance(touser, ToUser):
             if touser.message:
@@ -254,3 +268,179 @@ class MessageRouter:
             touser += f'\n{prompt_str}'
 
         return touser
+
+    async def _get_prompt(self, session_id: str, session_state) -> str:
+        """Return the prompt text for a session, with its validation and
+        unread mail notices, from the cache if the entry is fresh and
+        still for the session's current room.  Entries for the mail room
+        are never reused, since reading mail is what clears the flag."""
+        now = time.monotonic()
+        room_id = session_state.current_room
+        entry = self._prompt_cache.get(session_id)
+        if (entry and entry['room_id'] == room_id
+                and room_id != SystemRoomIDs.MAIL_ID
+                and now - entry['fetched_at'] < self._prompt_cache_ttl):
+            return entry['prompt']
+
+        username = session_state.username
+        try:
+            prompt_str = await self._build_prompt(username, room_id)
+        except Exception as e:
+            log.warning(
+                f"Prompt query failed for {username}: {e} - falling back")
+            prompt_str, complete = await self._build_prompt_from_objects(
+                username, room_id)
+            if not complete:
+                # don't hold on to an incomplete prompt
+                return prompt_str
+
+        # drop stale entries so sessions that have gone away don't linger
+        self._prompt_cache = {
+            sid: e for sid, e in self._prompt_cache.items()
+            if now - e['fetched_at'] < self._prompt_cache_ttl
+        }
+        self._prompt_cache[session_id] = {
+            'room_id': room_id,
+            'prompt': prompt_str,
+            'fetched_at': now,
+        }
+        return prompt_str
+
+    async def _fetch_prompt_context(self, username: str, room_id: int) -> tuple:
+        """Fetch everything the prompt needs but the validation count in
+        one query: the user's permission level, whether they have unread
+        mail they're allowed to read, and the current room's name."""
+        query = """
+            SELECT
+                (SELECT permission_level FROM users WHERE username = ?),
+                EXISTS (
+                    SELECT 1 FROM room_messages rm
+                    JOIN messages m ON m.id = rm.message_id
+                    WHERE rm.room_id = ?
+                    AND rm.message_id > COALESCE((
+                        SELECT last_seen_message_id FROM user_room_state
+                        WHERE username = ? AND room_id = ?), 0)
+                    AND (m.recipient IS NULL OR m.recipient = ''
+                         OR m.sender = ? OR m.recipient = ?)
+                ),
+                (SELECT name FROM rooms WHERE id = ?)
+        """
+        mail_id = SystemRoomIDs.MAIL_ID
+        result = await self.db.execute(query, (
+            username, mail_id, username, mail_id, username, username, room_id
+        ))
+        return result[0]
+
+    async def _build_prompt(self, username: str, room_id: int) -> str:
+        """Build a session's prompt from the combined prompt query."""
+        level, has_mail, room_name = await self._fetch_prompt_context(
+            username, room_id)
+        if level is None:
+            raise RuntimeError(f"User '{username}' not found.")
+
+        prompt = []
+        # sort out notifications. first, pending validations
+        if level >= PermissionLevel.AIDE:
+            count = await self._pending_validation_count()
+            if count:
+                vword, isword = _VALIDATION_WORDS[count > 1]
+                prompt.append(f"* There {isword} {count} {vword} to review")
+
+        # next, notify of new mail
+        if has_mail:
+            prompt.append(_UNREAD_MAIL_NOTICE)
+
+        if room_name:
+            prompt.append(Room.prompt_for(room_name))
+        else:
+            prompt.append(f"In Room {room_id}. {_NO_ROOM_PROMPT}")
+        return "\n".join(prompt)
+
+    async def _build_prompt_from_objects(self, username: str, room_id: int) -> tuple[str, bool]:
+        """Build a session's prompt by loading the user and rooms, for
+        when the combined query fails.  Returns the prompt and whether
+        every lookup succeeded."""
+        # the three lookups are independent, so run them together; a
+        # failed notice is left off rather than failing the whole prompt
+        results = await asyncio.gather(
+            self._validation_notice(username),
+            self._has_unread_mail(username),
+            self._get_room_prompt(room_id),
+            return_exceptions=True
+        )
+        complete = True
+        for result in results:
+            # room errors derive from BaseException, so check for that
+            if isinstance(result, BaseException):
+                log.warning(f"Prompt lookup failed for {username}: {result}")
+                complete = False
+        validation_notice, has_mail, room_prompt = results
+        if isinstance(room_prompt, BaseException):
+            room_prompt = f"In Room {room_id}. {_NO_ROOM_PROMPT}"
+
+        prompt = []
+        if isinstance(validation_notice, str):
+            prompt.append(validation_notice)
+        if has_mail is True:
+            prompt.append(_UNREAD_MAIL_NOTICE)
+        prompt.append(room_prompt)
+        return "\n".join(prompt), complete
+
+    async def _validation_notice(self, username: str) -> str | None:
+        """Return the pending validations notice if username is an aide
+        and there are any to review."""
+        user = User(self.db, username)
+        await user.load()
+        if user.permission_level < PermissionLevel.AIDE:
+            return None
+        count = await self._pending_validation_count()
+        if not count:
+            return None
+        vword, isword = _VALIDATION_WORDS[count > 1]
+        return f"* There {isword} {count} {vword} to review"
+
+    async def _has_unread_mail(self, username: str) -> bool:
+        """Return True if username has unread messages in Mail."""
+        mail = Room(self.db, self.config, SystemRoomIDs.MAIL_ID)
+        await mail.load()
+        return await mail.has_unread_messages(username)
+
+    async def _pending_validation_count(self) -> int:
+        """Return the number of pending validations, re-querying at most
+        once per validation_count_ttl seconds."""
+        now = time.monotonic()
+        fetched_at, count = self._pv_count_cache
+        if now - fetched_at < self._pv_ttl:
+            return count
+        query = "SELECT COUNT(*) FROM pending_validations"
+        result = await self.db.execute(query, [])
+        count = result[0][0]
+        self._pv_count_cache = (now, count)
+        return count
+
+    def invalidate_validation_count(self, session_id: str = None):
+        """Force the next prompt to re-count pending validations, and
+        rebuild session_id's cached prompt if given."""
+        self._pv_count_cache = (0.0, 0)
+        if session_id:
+            self._prompt_cache.pop(session_id, None)
+
+    async def _get_room_prompt(self, room_id: int) -> str:
+        """Look up a room's prompt line, reusing the last one looked up
+        if it's the same room and still fresh."""
+        now = time.monotonic()
+        if (room_id == self._room_cache_id
+                and now - self._room_cache_at < self._prompt_cache_ttl):
+            return self._room_cache_prompt
+
+        try:
+            room = Room(self.db, self.config, room_id)
+            await room.load()
+        except Exception:
+            # don't cache the fallback; the room may load next time
+            return f"In Room {room_id}. {_NO_ROOM_PROMPT}"
+
+        self._room_cache_id = room_id
+        self._room_cache_prompt = room.prompt_suffix
+        self._room_cache_at = now
+        return room.prompt_suffix
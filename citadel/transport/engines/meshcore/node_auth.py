@@ -9,6 +9,8 @@ import logging
 from datetime import datetime, timedelta, UTC
 from typing import Optional
 
+from citadel.transport.engines.meshcore.util import utc_now_str
+
 log = logging.getLogger(__name__)
 
 
@@ -18,24 +20,26 @@ class NodeAuth:
     def __init__(self, config, db):
         self.config = config
         self.db = db
+        days = config.auth.get("password_cache_duration", 14)
+        self._pw_cache_ttl = timedelta(days=days)
 
     async def node_has_password_cache(self, node_id: str) -> bool:
         """Check if node has valid password cache. This function forces
         password expiration such that a user must input their password at
         least every 2 weeks."""
-        days = self.config.auth.get("password_cache_duration", 14)
-        query = "SELECT last_pw_use, username FROM mc_passwd_cache WHERE node_id = ?"
+        # last_pw_use is stored as UTC "%Y-%m-%d %H:%M:%S", which sorts
+        # correctly as text, so SQLite can do the expiry check itself
+        query = """SELECT username FROM mc_passwd_cache
+            WHERE node_id = ? AND last_pw_use >= ?"""
+        oldest = datetime.now(UTC) - self._pw_cache_ttl
         try:
-            result = await self.db.execute(query, (node_id,))
+            result = await self.db.execute(
+                query, (node_id, oldest.strftime("%Y-%m-%d %H:%M:%S")))
             if result:
-                dt = datetime.strptime(result[0][0], "%Y-%m-%d %H:%M:%S")
-                two_weeks_ago = datetime.now() - timedelta(days=days)
-                if dt < two_weeks_ago:
-                    log.debug(f"Password cache for {node_id} is expired")
-                    return False  # cache is expired
-                return result[0][1]  # username, cache is valid
-            log.debug(f'No passwd cache DB result: "{result}"')
-            return False  # has no cache at all
+                return result[0][0]  # username, cache is valid
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(f"No valid password cache for {node_id}")
+            return False  # cache is missing or expired
         except Exception as e:
             log.exception(
                 f"Uncaught exception checking for password cache for {node_id}: {e}")
@@ -55,11 +59,28 @@ class NodeAuth:
             ON CONFLICT(node_id) DO UPDATE SET
                 last_pw_use = excluded.last_pw_use
         """
-        log.debug(f"Updating MeshCore password cache for {username}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Updating MeshCore password cache for {username}")
 
-        now = datetime.now(UTC).strftime('%Y-%m-%d %H:%M:%S')
+        now = utc_now_str('%Y-%m-%d %H:%M:%S')
         await self.db.execute(query, (node_id, now))
 
+    async def refresh_for_login(self, username: str, node_id: str):
+        """give node_id a fresh password cache entry for username in a
+        single write.  does the work of touch_password_cache and
+        set_cache_username together."""
+        query = """INSERT INTO mc_passwd_cache
+            (node_id, last_pw_use, username) VALUES (?, ?, ?)
+            ON CONFLICT(node_id) DO UPDATE SET
+                last_pw_use = excluded.last_pw_use,
+                username = excluded.username
+        """
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Updating MeshCore password cache for {username}")
+
+        now = utc_now_str('%Y-%m-%d %H:%M:%S')
+        await self.db.execute(query, (node_id, now, username))
+
     async def remove_cache_node_id(self, node_id: str):
         """remove a node_id from the password cache.  to be used when the
         user proactively logs out, not when their session expires due
@@ -6,7 +6,11 @@ Extracted from the main transport engine for better separation of concerns.
 """
 
 import asyncio
+import functools
 import logging
+import random
+import time
+from collections import OrderedDict
 from datetime import datetime, UTC
 from serial import SerialException
 from typing import Union, List
@@ -14,49 +18,78 @@ from typing import Union, List
 from citadel.message.manager import format_timestamp
 from citadel.transport.packets import ToUser
 from citadel.commands.responses import MessageResponse
+from citadel.transport.engines.meshcore.config import MeshCoreConfig
 from meshcore import EventType
 from dateutil.parser import parse as dateparse
 
 log = logging.getLogger(__name__)
 
+# formatted message headers to keep.  the same message is sent to every
+# user who reads it, so popular rooms hit this a lot
+_HEADER_CACHE_SIZE = 256
+
+
+def _split_at_spaces(message: str, limit: int) -> List[str]:
+    """Cut message into pieces of at most limit characters, breaking at
+    the last space that fits.  A word too long for a piece is cut where
+    the piece ends."""
+    # slice the message rather than splitting it into words and joining
+    # them back up
+    chunks = []
+    start = 0
+    end = len(message)
+    while end - start > limit:
+        brk = message.rfind(' ', start, start + limit + 1)
+        if brk > start:
+            chunks.append(message[start:brk])
+            start = brk + 1
+        else:
+            chunks.append(message[start:start + limit])
+            start += limit
+    chunks.append(message[start:])
+    return chunks
+
 
 class ProtocolHandler:
     """Handles low-level MeshCore protocol operations."""
 
-    def __init__(self, config, db, meshcore):
+    def __init__(self, config, db, meshcore, settings: MeshCoreConfig = None):
         self.config = config
         self.db = db
         self.meshcore = meshcore
         self._acks = {}  # ACK tracking dictionary
-        # Derive mc_config from main config
-        self.mc_config = config.transport.get("meshcore", {})
+        self.settings = settings or MeshCoreConfig.from_config(config)
+        # These are read on every send, so keep them close at hand
+        self._max_packet_size = self.settings.max_packet_size
+        self._inter_packet_delay = self.settings.inter_packet_delay
+        self._max_retries = self.settings.max_retries
+        self._retry_delay = self.settings.retry_delay
+        # monotonic time the last packet went out, and when each node's
+        # last packet came in, for pacing
+        self._last_send = 0.0
+        self._last_heard = {}
+        # header fields -> formatted header, least recently used first
+        self._headers = OrderedDict()
         # Set up the appropriate send method
         self._setup_send_method()
 
     def _setup_send_method(self):
         """Set up the send method with retry configuration."""
         if hasattr(self.meshcore, 'commands') and hasattr(self.meshcore.commands, 'send_msg_with_retry'):
-            # Create a wrapper function with config pre-applied
-            max_attempts = self.mc_config.get("max_retries", 3)
-            max_flood_attempts = self.mc_config.get("max_flood_attempts", 3)
-            flood_after = self.mc_config.get("flood_after", 2)
-            send_timeout = self.mc_config.get("send_timeout", 0)
-
-            async def send_with_retry(node_id, message):
-                return await self.meshcore.commands.send_msg_with_retry(
-                    node_id,
-                    message,
-                    max_attempts=max_attempts,
-                    max_flood_attempts=max_flood_attempts,
-                    flood_after=flood_after,
-                    timeout=send_timeout
-                )
-            self.send_msg = send_with_retry
+            # Bind the retry config once so each packet send only has
+            # to pass the node and message
+            self.send_msg = functools.partial(
+                self.meshcore.commands.send_msg_with_retry,
+                max_attempts=self._max_retries,
+                max_flood_attempts=self.settings.max_flood_attempts,
+                flood_after=self.settings.flood_after,
+                timeout=self.settings.send_timeout
+            )
         else:
             # Fallback: create manual retry wrapper
             async def send_with_manual_retry(node_id, message):
-                max_retries = self.mc_config.get("max_retries", 3)
-                retry_delay = self.mc_config.get("retry_delay", 1.0)
+                max_retries = self._max_retries
+                retry_delay = self._retry_delay
 
                 # TODO: copy retry function from meshcore_py to here
                 for attempt in range(max_retries):
@@ -64,11 +97,14 @@ class ProtocolHandler:
                         result = await self.meshcore.commands.send_msg(node_id, message)
                         if result:
                             return result
-                    except Exception as e:
+                    except (OSError, SerialException) as e:
                         log.warning(f"Send attempt {attempt + 1} failed: {e}")
 
                     if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_delay)
+                        # back off exponentially, with jitter so nodes
+                        # that failed together don't retry together
+                        await asyncio.sleep(
+                            retry_delay * 2 ** attempt * random.uniform(0.5, 1.5))
 
                 return None
 
@@ -76,14 +112,38 @@ class ProtocolHandler:
 
     def format_message(self, message: MessageResponse) -> str:
         """Format a BBS message for transmission to a node."""
-        utc_timestamp = dateparse(message.timestamp)
+        header = self._format_header(message)
+        content = "[Message from blocked sender]" if message.blocked else message.content
+        return f"{header}\n{content}"
+
+    def _format_header(self, message: MessageResponse) -> str:
+        """Build a message's header line, reusing it if this message has
+        been formatted recently."""
+        # everything the header shows is in the key, so a changed
+        # display name or a reused message id gets a fresh header
+        key = (message.id, message.timestamp, message.sender,
+               message.display_name, message.recipient)
+        header = self._headers.get(key)
+        if header is not None:
+            self._headers.move_to_end(key)
+            return header
+
+        try:
+            # stored timestamps are ISO 8601, which fromisoformat
+            # parses far faster than dateutil does
+            utc_timestamp = datetime.fromisoformat(message.timestamp)
+        except ValueError:
+            utc_timestamp = dateparse(message.timestamp)
         timestamp = format_timestamp(self.config, utc_timestamp)
         to_str = ""
         if message.recipient:
             to_str = f" To: {message.recipient}"
         header = f"[{message.id}] From: {message.display_name} ({message.sender}){to_str} - {timestamp}"
-        content = "[Message from blocked sender]" if message.blocked else message.content
-        return f"{header}\n{content}"
+
+        self._headers[key] = header
+        if len(self._headers) > _HEADER_CACHE_SIZE:
+            self._headers.popitem(last=False)
+        return header
 
     def _chunk_message(self, message: Union[str, List], max_packet_length: int) -> List[str]:
         """Split the message into appropriately sized chunks. Returns a list of strings."""
@@ -91,37 +151,32 @@ class ProtocolHandler:
             if isinstance(message, list):
                 log.error(f"Don't know how to split '{message}'")
                 return ["Oops, check the log"]
-            words = message.split(" ")
         else:
             return [""]
-
-        approx_chunks = len(message) / max_packet_length
-        if approx_chunks >= 10:
-            max_packet_length -= len('[xx/xx]')
-        else:
-            max_packet_length -= len('[x/x]')
-
-        chunks = []
-        chunk = []
-        chunk_size = 0
-        for word in words:
-            wordlen = len(word)
-            if chunk_size + wordlen + 1 < max_packet_length:
-                chunk.append(word)
-                chunk_size += wordlen + 1
-            else:
-                chunks.append(" ".join(chunk))
-                chunk = [word]
-                chunk_size = wordlen + 1
-
-        if len(chunk) > 0:
-            chunks.append(" ".join(chunk))
-
-        if approx_chunks > 1:
-            len_chunks = len(chunks)
-            for i in range(len_chunks):
-                chunks[i] += f'[{i+1}/{len_chunks}]'
-        return chunks
+        if len(message) <= max_packet_length:
+            return [message]
+
+        # reserve room for the "[i/n]" suffix, with n's digit count
+        # estimated from the message length.  cutting at spaces can need
+        # more chunks than the estimate, so repack with wider numbers if
+        # the count outgrows it
+        width = 1
+        while True:
+            limit = max(max_packet_length - len('[/]') - 2 * width, 1)
+            if len(message) <= limit * (10 ** width - 1):
+                chunks = _split_at_spaces(message, limit)
+                if len(chunks) < 10 ** width:
+                    break
+            width += 1
+
+        len_chunks = len(chunks)
+        return [f'{chunk}[{i}/{len_chunks}]'
+                for i, chunk in enumerate(chunks, 1)]
+
+    def note_received(self, node_id: str):
+        """Record that a packet just came in from node_id, so the reply
+        to it is paced from then."""
+        self._last_heard[node_id] = time.monotonic()
 
     async def send_to_node(self, node_id: str, username: str, message: Union[str, ToUser, List]) -> bool:
         """Send a message to a mesh node via MeshCore. Returns False if
@@ -135,22 +190,28 @@ class ProtocolHandler:
         else:
             text = message
 
-        max_packet_length = self.mc_config.get("max_packet_size", 140)
-
-        chunks = self._chunk_message(text, max_packet_length)
-        inter_packet_delay = self.mc_config.get("inter_packet_delay", 0.5)
+        chunks = self._chunk_message(text, self._max_packet_size)
+        heard = self._last_heard.pop(node_id, 0.0)
 
         for chunk in chunks:
+            # inter_packet_delay is a minimum gap between packets, both
+            # ours and the node's own (its radio needs time to turn
+            # around), so only sleep off whatever hasn't already passed
+            since = max(self._last_send, heard)
+            wait = self._inter_packet_delay - (time.monotonic() - since)
+            if wait > 0:
+                await asyncio.sleep(wait)
             sent = await self._send_packet(username, node_id, chunk)
-            await asyncio.sleep(inter_packet_delay)
+            self._last_send = time.monotonic()
         return sent
 
     async def _send_packet(self, username: str, node_id: str, chunk: str) -> bool:
         """Send a single packet to a node. This assumes that the packet
         is a safe size to send. Blocks until the ack has been
         received."""
-        log.debug(
-            f'Sending packet to {username} at {node_id}: {len(chunk)} bytes, content: "{chunk[:50]}..."')
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                f'Sending packet to {username} at {node_id}: {len(chunk)} bytes, content: "{chunk[:50]}..."')
 
         try:
             result = await self.send_msg(node_id, chunk)
@@ -15,12 +15,13 @@ log = logging.getLogger(__name__)
 class SessionCoordinator:
     """Manages BBS listeners and session lifecycle coordination."""
 
-    def __init__(self, config, session_mgr, create_monitored_task_func):
+    def __init__(self, config, session_mgr, create_task_func, schedule_threadsafe_func):
         self.config = config
         self.session_mgr = session_mgr
-        self._create_monitored_task = create_monitored_task_func
-        # Derive mc_config from main config
-        self.mc_config = config.transport.get("meshcore", {})
+        # listeners are started on the event loop; logout notices come
+        # from the session sweeper's thread
+        self._create_task = create_task_func
+        self._schedule_threadsafe = schedule_threadsafe_func
         self.listeners: Dict[str, asyncio.Task] = {}
         self._send_to_node_func = None  # Will be set by parent
         self._disconnect_func = None    # Will be set by parent
@@ -48,16 +49,12 @@ class SessionCoordinator:
 
                     log.debug(f'Waiting for BBS msgs for {session_id}')
                     message = await state.msg_queue.get()
-                    if isinstance(message, list):
-                        log.debug('BBS message is a LIST')
-                    else:
-                        log.debug('BBS message is NOT a list')
-                    log.debug(f'Received BBS msg for {session_id}: {message}')
-
-                    # Add inter_packet_delay before sending messages
-                    inter_packet_delay = self.mc_config.get(
-                        "inter_packet_delay", 0.5)
-                    await asyncio.sleep(inter_packet_delay)
+                    if log.isEnabledFor(logging.DEBUG):
+                        if isinstance(message, list):
+                            log.debug('BBS message is a LIST')
+                        else:
+                            log.debug('BBS message is NOT a list')
+                        log.debug(f'Received BBS msg for {session_id}: {message}')
 
                     if isinstance(message, list):
                         for msg in message:
@@ -140,7 +137,7 @@ class SessionCoordinator:
 
             log.info(f'BBS listener for {session_id} terminated')
 
-        task = self._create_monitored_task(
+        task = self._create_task(
             listen(), f"bbs_listener_{session_id}")
         self.listeners[session_id] = task
 
@@ -201,7 +198,7 @@ class SessionCoordinator:
                     # Send logout notification using threadsafe task creation
                     log.info(
                         f"Sending logout notification to session {session_id}: {message}")
-                    task_result = self._create_monitored_task(
+                    task_result = self._schedule_threadsafe(
                         self._send_to_node_func(
                             state.node_id, state.username, message),
                         f"logout_notification_{session_id}"
@@ -11,9 +11,28 @@ from datetime import datetime, UTC
 from meshcore import EventType
 
 from citadel.logging_lock import AsyncLoggingLock
+from citadel.transport.errors import TransportError
 
 log = logging.getLogger(__name__)
 
+# formatted "now" strings, keyed by format, refreshed at most once a
+# second.  adverts and messages can arrive in floods, and second-level
+# resolution is plenty for last_seen style columns.
+_NOW_CACHE = {}
+
+
+def utc_now_str(fmt: str = None) -> str:
+    """Return the current UTC time as an ISO string, or formatted with
+    fmt if given, reusing the cached string if it's under a second old."""
+    now = time.time()
+    cached = _NOW_CACHE.get(fmt)
+    if cached and now - cached[0] < 1.0:
+        return cached[1]
+    dt = datetime.fromtimestamp(now, UTC)
+    value = dt.strftime(fmt) if fmt else dt.isoformat()
+    _NOW_CACHE[fmt] = (now, value)
+    return value
+
 
 class AdvertScheduler:
     """Schedule an advert in a cancelable way. Modify the
@@ -36,7 +55,6 @@ class AdvertScheduler:
                     log.info(f"Sending advert (flood={flood})")
                     result = await self.meshcore.commands.send_advert(flood=flood)
                     if result.type == EventType.ERROR:
-                        from citadel.transport.manager import TransportError
                         raise TransportError(
                             f"Unable to send advert: {result.payload}")
                 try:
@@ -85,33 +103,45 @@ class WatchdogFeeder:
 
 
 class MessageDeduplicator:
-    """A simple class to provide message de-duplication services"""
+    """A simple class to provide message de-duplication services.
+
+    Only ever used from the event loop thread, and nothing here awaits
+    while touching self.seen, so no lock is needed."""
 
     def __init__(self, ttl=30):
-        self.seen = {}  # message_hash: timestamp
+        self.seen = {}  # message_hash: monotonic timestamp
         self.ttl = ttl  # seconds
-        self._lock = asyncio.Lock()
-
-    async def is_duplicate(self, node_id: str, timestamp: int, message: str) -> bool:
-        text = '::'.join([node_id, str(timestamp), message])
-        msg_hash = hashlib.sha256(text.encode()).hexdigest()
-        async with self._lock:
-            now = time.time()
-            if msg_hash in self.seen and now - self.seen[msg_hash] < self.ttl:
+
+    def is_duplicate(self, node_id: str, timestamp: int, message: str) -> bool:
+        # feed the hasher piecewise rather than building the joined
+        # string; an 8-byte blake2b is plenty for a 30s window
+        hasher = hashlib.blake2b(digest_size=8)
+        hasher.update(node_id.encode())
+        hasher.update(b'::')
+        hasher.update(str(timestamp).encode())
+        hasher.update(b'::')
+        hasher.update(message.encode())
+        msg_hash = hasher.digest()
+        now = time.monotonic()
+        seen_at = self.seen.get(msg_hash)
+        if seen_at is not None:
+            if now - seen_at < self.ttl:
                 return True
-            self.seen[msg_hash] = now
-            return False
+            # expired; treat it as new rather than waiting for
+            # clear_expired to get around to it
+            del self.seen[msg_hash]
+        self.seen[msg_hash] = now
+        return False
 
     async def clear_expired(self):
         """Call this frequently to avoid the message hash table growing
         too large"""
         while True:
             i = 0
-            now = time.time()
-            async with self._lock:
-                for msg_hash in list(self.seen.keys()):
-                    if now - self.seen[msg_hash] > self.ttl:
-                        del self.seen[msg_hash]
-                        i += 1
+            now = time.monotonic()
+            for msg_hash in list(self.seen.keys()):
+                if now - self.seen[msg_hash] > self.ttl:
+                    del self.seen[msg_hash]
+                    i += 1
             log.debug(f"Dedupe ran and removed {i} messages from the pool")
             await asyncio.sleep(60)
@@ -0,0 +1,2 @@
+class TransportError(Exception):
+    """Indicates an error has occurred in the transport system"""
@@ -8,15 +8,12 @@ from typing import Dict, Any, Optional, Callable
 
 from citadel.config import Config
 from citadel.transport.engines.meshcore import MeshCoreTransportEngine
+from citadel.transport.errors import TransportError
 
 
 log = logging.getLogger(__name__)
 
 
-class TransportError(Exception):
-    """Indicates an error has occurred in the transport system"""
-
-
 class TransportManager:
     """
     Manages multiple transport engines and coordinates their lifecycle.
@@ -2,7 +2,7 @@
 
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, List
 
 from citadel.commands.responses import MessageResponse
 
@@ -30,3 +30,23 @@ class FromUser:
     session_id: str
     payload: Any
     payload_type: FromUserType
+
+
+@dataclass
+class MessageBatch:
+    """A command response normalized to a list of packets, with an
+    optional header to send ahead of them and whether the last packet
+    should carry the prompt."""
+    messages: List[ToUser]
+    header: Optional[str] = None
+    prompt_on_last: bool = True
+
+    @classmethod
+    def from_response(cls, response) -> "MessageBatch":
+        """Wrap whatever CommandProcessor.process returned: nothing, a
+        single ToUser, or a list of them."""
+        if not response:
+            return cls(messages=[])
+        if isinstance(response, list):
+            return cls(messages=list(response))
+        return cls(messages=[response])
@@ -145,8 +145,7 @@ class LoginWorkflow(Workflow):
                 )
                 from citadel.transport.engines.meshcore.node_auth import NodeAuth
                 auth = NodeAuth(context.config, context.db)
-                await auth.touch_password_cache(username, state.node_id)
-                await auth.set_cache_username(username, state.node_id)
+                await auth.refresh_for_login(username, state.node_id)
             room = Room(context.db, context.config, state.current_room)
             await room.load()
             return ToUser(
@@ -4,6 +4,11 @@ import logging
 import sys
 #import tracemalloc
 
+try:
+    import uvloop   # faster event loop, if it's available
+except ImportError:
+    uvloop = None
+
 from citadel.commands.base import CommandContext
 from citadel.config import Config
 from citadel.db.manager import DatabaseManager
@@ -76,11 +81,16 @@ def parse_arguments():
 async def main():
     """Main entry point."""
     global log
-    config = db_mgr = session_mgr = message_mgr = None
+    config = db_mgr = session_mgr = message_mgr = transport_mgr = None
 
     args = parse_arguments()
     log_level = "DEBUG" if args.debug else None
 
+    # start new tasks eagerly, so ones that finish without suspending
+    # never touch the scheduler (python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     try:
         # Initialize system components
         config, db_mgr, session_mgr, message_mgr = await initialize_system(log_level, args.config)
@@ -101,7 +111,7 @@ async def main():
         raise
     finally:
         # Always attempt graceful shutdown
-        if 'transport_mgr' in locals():
+        if transport_mgr:
             await shutdown(db_mgr, session_mgr, transport_mgr)
         elif db_mgr or session_mgr:
             await shutdown(db_mgr, session_mgr)
@@ -110,7 +120,10 @@ async def main():
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if uvloop:
+            uvloop.run(main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         # Clean exit - shutdown already handled in main()
         pass
@@ -16,12 +16,11 @@ from citadel.transport.packets import ToUser
 def mock_coordinator_components():
     """Create mocked components for SessionCoordinator testing."""
     config = Mock()
-    config.transport = {"meshcore": {"inter_packet_delay": 0.01}}  # Fast for testing
 
     session_mgr = Mock()
-    create_monitored_task_func = Mock(side_effect=lambda coro, name: asyncio.create_task(coro))
+    create_task_func = Mock(side_effect=lambda coro, name: asyncio.create_task(coro))
 
-    coordinator = SessionCoordinator(config, session_mgr, create_monitored_task_func)
+    coordinator = SessionCoordinator(config, session_mgr, create_task_func, Mock())
     coordinator._send_to_node_func = AsyncMock(return_value=True)
     coordinator._disconnect_func = AsyncMock()
 
@@ -200,14 +199,20 @@ async def test_session_expiry_terminates_cleanly(mock_coordinator_components):
 
 
 @pytest.mark.asyncio
-async def test_inter_packet_delay_respected(mock_coordinator_components):
-    """Test that configured inter_packet_delay is honored."""
-    coordinator, session_mgr = mock_coordinator_components
+async def test_listener_adds_no_inter_packet_delay():
+    """Test that the listener hands messages straight to send_to_node;
+    packet pacing, including the pause before replying to a node, is
+    ProtocolHandler's job, not the listener's."""
+    config = Mock()
+    config.transport = {"meshcore": {"inter_packet_delay": 5}}
+    session_mgr = Mock()
+    coordinator = SessionCoordinator(
+        config, session_mgr,
+        Mock(side_effect=lambda coro, name: asyncio.create_task(coro)), Mock())
+    coordinator._send_to_node_func = AsyncMock(return_value=True)
+    coordinator._disconnect_func = AsyncMock()
     session_id = "test_session"
 
-    # Set specific delay
-    coordinator.mc_config = {"inter_packet_delay": 0.1}
-
     # Mock session state
     mock_state = Mock()
     mock_state.node_id = "test_node"
@@ -215,19 +220,13 @@ async def test_inter_packet_delay_respected(mock_coordinator_components):
     mock_state.msg_queue = asyncio.Queue()
     session_mgr.get_session_state.return_value = mock_state
 
-    # Put message in queue
     await mock_state.msg_queue.put(ToUser(session_id=session_id, text="Test message"))
 
-    coordinator._send_to_node_func.return_value = True
-
-    start_time = asyncio.get_event_loop().time()
-
-    # Start listener
     await coordinator.start_bbs_listener(session_id)
     listener_task = coordinator.listeners[session_id]
 
-    # Wait for message processing
-    await asyncio.sleep(0.15)
+    # far less than the configured delay
+    await asyncio.sleep(0.1)
 
     listener_task.cancel()
     try:
@@ -235,10 +234,6 @@ async def test_inter_packet_delay_respected(mock_coordinator_components):
     except asyncio.CancelledError:
         pass
 
-    end_time = asyncio.get_event_loop().time()
-
-    # Should have taken at least the inter_packet_delay
-    assert (end_time - start_time) >= 0.1
     assert coordinator._send_to_node_func.call_count == 1
 
 
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import pytest
 import pytest_asyncio
@@ -69,6 +70,37 @@ async def test_multiple_writes_queued(db_manager):
     assert results[0][1] == "msg0"
     assert results[-1][1] == "msg4"
 
+
+@pytest.mark.asyncio
+async def test_transaction_commits_on_exit(db_manager):
+    async with db_manager.transaction() as conn:
+        await conn.execute("INSERT INTO test (value) VALUES (?)", ("a",))
+        await conn.execute("INSERT INTO test (value) VALUES (?)", ("b",))
+    results = await db_manager.execute("SELECT value FROM test")
+    assert [r[0] for r in results] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_transaction_rolls_back_when_cancelled(db_manager):
+    started = asyncio.Event()
+
+    async def writer():
+        async with db_manager.transaction() as conn:
+            await conn.execute("INSERT INTO test (value) VALUES (?)", ("a",))
+            started.set()
+            await asyncio.Event().wait()
+
+    task = asyncio.create_task(writer())
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # the cancelled insert mustn't ride along with the next commit
+    await db_manager.execute("INSERT INTO test (value) VALUES (?)", ("b",))
+    results = await db_manager.execute("SELECT value FROM test")
+    assert [r[0] for r in results] == ["b"]
+
 # -------------------------------
 # ❌ Unhappy Path Tests
 # -------------------------------
@@ -87,6 +119,24 @@ async def test_invalid_params_raises(db_manager):
         await db_manager.execute("INSERT INTO test (value) VALUES (?)", ())
 
 
+@pytest.mark.asyncio
+async def test_transaction_rolls_back_on_error(db_manager):
+    with pytest.raises(RuntimeError, match="Database error occurred"):
+        async with db_manager.transaction() as conn:
+            await conn.execute("INSERT INTO test (value) VALUES (?)", ("a",))
+            await conn.execute("INSERT INTO test (value) VALUES (?)", ())
+    results = await db_manager.execute("SELECT * FROM test")
+    assert results == []
+
+
+@pytest.mark.asyncio
+async def test_disk_db_uses_wal(db_manager):
+    results = await db_manager.execute("PRAGMA journal_mode")
+    assert results == [("wal",)]
+    results = await db_manager.execute("PRAGMA synchronous")
+    assert results == [(1,)]  # NORMAL
+
+
 @pytest.mark.asyncio
 async def test_shutdown_closes_connection(db_manager):
     await db_manager.shutdown()
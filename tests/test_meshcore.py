@@ -23,6 +23,23 @@ async def context():
     await data["db"].shutdown()
 
 
+@pytest_asyncio.fixture
+async def temp_db(tmp_path):
+    from citadel.db.initializer import initialize_database
+
+    config = Config()
+    config.database = {"db_path": str(tmp_path / "citadel.db")}
+    DatabaseManager._instance = None
+    db = DatabaseManager(config)
+    await db.start()
+    await initialize_database(db, config)
+
+    yield db, config
+
+    await db.shutdown()
+    DatabaseManager._instance = None
+
+
 def test_chunk_message(context):
     # Test the protocol handler's chunking functionality
     from citadel.transport.engines.meshcore.protocol_handler import ProtocolHandler
@@ -51,6 +68,80 @@ def test_chunk_message(context):
     assert "this is a test" in chunks[0], "First chunk should contain beginning of message"
     assert "meshcore packets" in chunks[1], "Second chunk should contain end of message"
 
+    # a message that already fits is sent as is, with no marker
+    assert handler._chunk_message(long_msg[:140], 140) == [long_msg[:140]]
+
+    # three digit chunk counts still fit inside the packet
+    chunks = handler._chunk_message(long_msg * 80, 140)
+    assert len(chunks) >= 100
+    assert chunks[-1].endswith(f"[{len(chunks)}/{len(chunks)}]")
+    assert all(len(chunk) <= 140 for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_send_to_node_paces_only_between_packets(context):
+    from citadel.transport.engines.meshcore.protocol_handler import ProtocolHandler
+
+    handler = ProtocolHandler(context['config'], context['db'], Mock())
+    handler._inter_packet_delay = 0.2
+    handler._send_packet = AsyncMock(return_value=True)
+    long_msg = "word " * 60
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await handler.send_to_node("abc123", "alice", long_msg)
+    elapsed = loop.time() - start
+
+    # three chunks: two gaps between them, no sleep after the last one
+    assert handler._send_packet.call_count == 3
+    assert 0.4 <= elapsed < 0.6
+
+
+@pytest.mark.asyncio
+async def test_reply_waits_for_sender_to_turn_around(context):
+    from citadel.transport.engines.meshcore.protocol_handler import ProtocolHandler
+
+    handler = ProtocolHandler(context['config'], context['db'], Mock())
+    handler._inter_packet_delay = 0.2
+    handler._send_packet = AsyncMock(return_value=True)
+    loop = asyncio.get_running_loop()
+
+    # the reply to a node that was just heard from waits out the delay
+    handler.note_received("abc123")
+    start = loop.time()
+    await handler.send_to_node("abc123", "alice", "hi")
+    assert 0.2 <= loop.time() - start < 0.35
+
+    # once the delay has passed, a reply goes straight out
+    handler.note_received("def456")
+    await asyncio.sleep(0.2)
+    start = loop.time()
+    await handler.send_to_node("def456", "bob", "hi")
+    assert loop.time() - start < 0.1
+
+
+def test_format_message_reuses_header(context):
+    from citadel.transport.engines.meshcore.protocol_handler import ProtocolHandler
+    from citadel.commands.responses import MessageResponse
+
+    handler = ProtocolHandler(context['config'], context['db'], Mock())
+    msg = MessageResponse(id=7, sender="alice", display_name="Alice",
+                          timestamp="2025-01-02T03:04:05+00:00",
+                          room="Lobby", content="hello")
+    first = handler.format_message(msg)
+    assert first.startswith("[7] From: Alice (alice) - ")
+    assert first.endswith("\nhello")
+
+    # blocking only changes the body, not the cached header
+    msg.blocked = True
+    assert handler.format_message(msg) == \
+        first.replace("hello", "[Message from blocked sender]")
+
+    # a new display name isn't served a stale header
+    msg.display_name = "Al"
+    assert "From: Al (alice)" in handler.format_message(msg)
+    assert len(handler._headers) == 2
+
 
 def test_meshcore_engine_initialization(context):
     """Test that MeshCoreTransportEngine initializes correctly with proper parameter order."""
@@ -61,4 +152,344 @@ def test_meshcore_engine_initialization(context):
     assert engine.config == context['config']
     assert engine.db == context['db']
     assert engine.session_mgr == context['session_mgr']
-    assert hasattr(engine, 'mc_config')
\ No newline at end of file
+    assert hasattr(engine, 'mc_config')
+
+
+def test_utc_now_str_is_cached_within_a_second(monkeypatch):
+    from citadel.transport.engines.meshcore import util
+
+    now = [1700000000.0]
+    monkeypatch.setattr(util.time, "time", lambda: now[0])
+    util._NOW_CACHE.clear()
+
+    first = util.utc_now_str('%Y-%m-%d %H:%M:%S')
+    now[0] += 0.5
+    assert util.utc_now_str('%Y-%m-%d %H:%M:%S') == first
+    now[0] += 1.0
+    assert util.utc_now_str('%Y-%m-%d %H:%M:%S') != first
+    assert util.utc_now_str().startswith("2023-11-14T22:13:")
+
+
+def test_deduplicator_detects_repeats():
+    from citadel.transport.engines.meshcore.util import MessageDeduplicator
+
+    dedupe = MessageDeduplicator()
+    assert not dedupe.is_duplicate("abc123", 1000, "hello")
+    assert dedupe.is_duplicate("abc123", 1000, "hello")
+    assert not dedupe.is_duplicate("abc123", 1001, "hello")
+    assert not dedupe.is_duplicate("abc124", 1000, "hello")
+
+
+def test_deduplicator_forgets_after_ttl(monkeypatch):
+    from citadel.transport.engines.meshcore import util
+
+    now = [1000.0]
+    monkeypatch.setattr(util.time, "monotonic", lambda: now[0])
+    dedupe = util.MessageDeduplicator(ttl=30)
+
+    assert not dedupe.is_duplicate("abc123", 1000, "hello")
+    now[0] += 31
+    # a retransmit after the window is treated as a new message
+    assert not dedupe.is_duplicate("abc123", 1000, "hello")
+    assert dedupe.is_duplicate("abc123", 1000, "hello")
+    assert len(dedupe.seen) == 1
+
+
+@pytest.mark.asyncio
+async def test_safe_handler_is_awaitable_and_swallows_errors(context):
+    engine = MeshCoreTransportEngine(
+        context['config'], context['db'], context['session_mgr'])
+
+    async def broken(event):
+        raise ValueError("boom")
+
+    wrapped = engine.safe_handler(broken)
+    # MeshCore only awaits callbacks that look like coroutine functions
+    assert asyncio.iscoroutinefunction(wrapped)
+    await wrapped(object())
+
+
+def test_message_batch_from_response():
+    from citadel.transport.packets import MessageBatch
+
+    one = ToUser(session_id="s", text="one")
+    two = ToUser(session_id="s", text="two")
+
+    assert MessageBatch.from_response(None).messages == []
+    assert MessageBatch.from_response(one).messages == [one]
+    batch = MessageBatch.from_response([one, two])
+    assert batch.messages == [one, two]
+    assert batch.header is None
+    assert batch.prompt_on_last
+
+
+def test_contact_manager_drops_repeat_adverts(context, monkeypatch):
+    from citadel.transport.engines.meshcore import contacts
+
+    now = [500.0]
+    monkeypatch.setattr(contacts.time, "monotonic", lambda: now[0])
+    cm = contacts.ContactManager(None, context['db'], context['config'])
+
+    assert not cm._seen_recently("ab" * 32)
+    assert cm._seen_recently("ab" * 32)
+    now[0] += cm._advert_window
+    assert not cm._seen_recently("ab" * 32)
+
+
+@pytest.mark.asyncio
+async def test_contact_manager_stop_commits_pending_write(temp_db):
+    from citadel.transport.engines.meshcore import contacts
+
+    db, config = temp_db
+    cm = contacts.ContactManager(None, db, config)
+    await cm.start()
+
+    key = "ab" * 32
+    await cm._update_contact_record(key[:16], {"public_key": key,
+                                               "adv_name": "alice"})
+    # let the writer take the write and start waiting out the
+    # flush interval, then shut down underneath it
+    await asyncio.sleep(0.05)
+    assert cm._advert_queue.empty()
+    await cm.stop()
+
+    rows = await db.execute(
+        "SELECT name FROM mc_chat_contacts WHERE node_id = ?", (key[:16],))
+    assert rows == [("alice",)]
+
+
+@pytest.mark.asyncio
+async def test_sync_db_to_node_only_reads_needed_adverts(context):
+    from citadel.transport.engines.meshcore import contacts
+
+    db = Mock()
+    db.execute = AsyncMock(side_effect=[
+        [("dddd", "dddd"), ("cccc", "cccc"), ("bbbb", "bbbb"), ("aaaa", "aaaa")],
+        [("aaaa", '{"public_key": "aaaa"}'), ("bbbb", None),
+         ("cccc", '{"public_key": "cccc"}')],
+    ])
+    cm = contacts.ContactManager(None, db, context['config'])
+    cm._device_contacts = {"dddd": None}
+    cm.add_node = AsyncMock(return_value=True)
+
+    await cm.sync_db_to_node()
+    # one query for the list, one for the advert data it needs
+    assert db.execute.await_count == 2
+    assert db.execute.await_args.args[1] == ["aaaa", "bbbb", "cccc"]
+    # rows come back newest first and are added oldest first; the row
+    # with no stored advert and the one already on the device are skipped
+    assert [c.args[0] for c in cm.add_node.await_args_list] == ["aaaa", "cccc"]
+    assert cm.add_node.await_args_list[0].kwargs["contact_data"] == {"public_key": "aaaa"}
+
+
+@pytest.mark.asyncio
+async def test_expire_oldest_contact_keeps_device_order(context):
+    from types import SimpleNamespace
+    from citadel.transport.engines.meshcore import contacts
+
+    old_key, new_key = "a" * 64, "b" * 64
+    meshcore = Mock()
+    meshcore.commands.get_contacts = AsyncMock(return_value=SimpleNamespace(
+        type=None,
+        payload={new_key: {"public_key": new_key},
+                 old_key: {"public_key": old_key}}))
+    db = Mock()
+    db.execute = AsyncMock(return_value=[
+        ("a" * 16, "2025-01-01T00:00:00+00:00"),
+        ("b" * 16, "2025-06-01T00:00:00+00:00"),
+    ])
+    cm = contacts.ContactManager(meshcore, db, context['config'])
+
+    async def delete_node(node_id, pubkey):
+        cm._device_contacts.pop(pubkey)
+        return True
+    cm.delete_node = AsyncMock(side_effect=delete_node)
+
+    assert await cm._expire_oldest_contact()
+    assert db.execute.await_count == 1
+    cm.delete_node.assert_awaited_once_with("a" * 16, old_key)
+
+    # the device's contacts are now known, oldest first, so the next
+    # expiry needs neither the device nor the database
+    await cm._expire_oldest_contact()
+    cm.delete_node.assert_awaited_with("b" * 16, new_key)
+    assert meshcore.commands.get_contacts.await_count == 1
+    assert db.execute.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_device_contact_count_is_tracked_locally(context):
+    from types import SimpleNamespace
+    from citadel.transport.engines.meshcore import contacts
+
+    meshcore = Mock()
+    meshcore.commands.get_contacts = AsyncMock(return_value=SimpleNamespace(
+        type=None, payload={"a" * 64: {}, "b" * 64: {}}))
+    meshcore.commands.add_contact = AsyncMock(return_value=SimpleNamespace(type=None))
+    db = Mock()
+    db.execute = AsyncMock(return_value=[])
+    cm = contacts.ContactManager(meshcore, db, context['config'])
+    cm._contacts_cache["c" * 16] = "carol"
+    cm._queue_write = AsyncMock()
+
+    assert await cm._get_device_contact_count() == 2
+    assert await cm.add_node("c" * 16, contact_data={"public_key": "c" * 64})
+    assert await cm._get_device_contact_count() == 3
+    # only the first count went to the device
+    assert meshcore.commands.get_contacts.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_advert_from_device_contact_is_not_re_added(context):
+    from collections import OrderedDict
+    from types import SimpleNamespace
+    from citadel.transport.engines.meshcore import contacts
+
+    key = "e" * 64
+    meshcore = Mock()
+    meshcore.get_contact_by_key_prefix = Mock(
+        return_value={"public_key": key, "type": 1, "adv_name": "erin"})
+    cm = contacts.ContactManager(meshcore, Mock(), context['config'])
+    cm._device_contacts = OrderedDict([(key, None), ("f" * 64, None)])
+    cm._queue_write = AsyncMock()
+    cm.add_node = AsyncMock()
+
+    event = SimpleNamespace(type=None, payload={"public_key": key})
+    await cm.handle_advert(event)
+    cm.add_node.assert_not_awaited()
+    cm._queue_write.assert_awaited_once()
+    # it's now the most recently seen contact on the device
+    assert list(cm._device_contacts) == ["f" * 64, key]
+
+
+def test_meshcore_config_from_config(context):
+    from citadel.transport.engines.meshcore.config import MeshCoreConfig
+
+    config = context['config']
+    mc_config = config.transport.get("meshcore", {})
+    settings = MeshCoreConfig.from_config(config)
+
+    assert settings.max_packet_size == mc_config.get("max_packet_size", 140)
+    assert settings.inter_packet_delay == mc_config.get("inter_packet_delay", 0.5)
+    with pytest.raises(AttributeError):
+        settings.max_packet_size = 1
+
+
+@pytest.mark.asyncio
+async def test_pending_validation_count_is_memoized(context):
+    from citadel.transport.engines.meshcore.message_router import MessageRouter
+
+    db = Mock()
+    db.execute = AsyncMock(return_value=[(3,)])
+    router = MessageRouter(context['config'], db, context['session_mgr'],
+                           None, None, None, None)
+
+    assert await router._pending_validation_count() == 3
+    assert await router._pending_validation_count() == 3
+    assert db.execute.await_count == 1
+
+    router.invalidate_validation_count()
+    db.execute.return_value = [(2,)]
+    assert await router._pending_validation_count() == 2
+    assert db.execute.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_prompt_survives_failed_lookup(context):
+    from types import SimpleNamespace
+    from citadel.room.errors import RoomNotFoundError
+    from citadel.transport.engines.meshcore.message_router import MessageRouter
+
+    router = MessageRouter(context['config'], context['db'], context['session_mgr'],
+                           None, None, None, None)
+    router._fetch_prompt_context = AsyncMock(side_effect=RuntimeError("db busy"))
+    router._validation_notice = AsyncMock(return_value="* There is 1 validation to review")
+    router._has_unread_mail = AsyncMock(side_effect=RoomNotFoundError("gone"))
+    router._get_room_prompt = AsyncMock(return_value="In Lobby. What now? (H for help)")
+    state = SimpleNamespace(username="alice", current_room=1)
+
+    prompt = await router._get_prompt("s1", state)
+    assert prompt == "* There is 1 validation to review\nIn Lobby. What now? (H for help)"
+    # an incomplete prompt isn't cached
+    assert "s1" not in router._prompt_cache
+
+
+@pytest.mark.asyncio
+async def test_room_prompt_expires_with_prompt_cache(context, monkeypatch):
+    from citadel.transport.engines.meshcore import message_router
+    from citadel.transport.engines.meshcore.message_router import MessageRouter
+
+    names = iter(["Lobby", "Front Porch"])
+
+    class FakeRoom:
+        def __init__(self, db, config, room_id):
+            pass
+
+        async def load(self):
+            self.prompt_suffix = f"In {next(names)}. What now? (H for help)"
+
+    now = [100.0]
+    monkeypatch.setattr(message_router, "Room", FakeRoom)
+    monkeypatch.setattr(message_router.time, "monotonic", lambda: now[0])
+    router = MessageRouter(context['config'], context['db'], context['session_mgr'],
+                           None, None, None, None)
+
+    assert (await router._get_room_prompt(1)).startswith("In Lobby.")
+    assert (await router._get_room_prompt(1)).startswith("In Lobby.")
+    # a rename shows up once the entry is older than the TTL
+    now[0] += router._prompt_cache_ttl
+    assert (await router._get_room_prompt(1)).startswith("In Front Porch.")
+
+
+@pytest.mark.asyncio
+async def test_fetch_prompt_context_matches_room_objects(temp_db):
+    from citadel.auth.permissions import PermissionLevel
+    from citadel.room.room import Room, SystemRoomIDs
+    from citadel.user.user import User
+    from citadel.transport.engines.meshcore.message_router import MessageRouter
+
+    db, config = temp_db
+    for name in ("alice", "bob", "carol"):
+        await User.create(config, db, name, "pw", "salt")
+    for name, level in (("alice", PermissionLevel.AIDE),
+                        ("bob", PermissionLevel.USER)):
+        user = User(db, name)
+        await user.load()
+        await user.set_permission_level(level)
+
+    mail = Room(db, config, SystemRoomIDs.MAIL_ID)
+    await mail.load()
+    await mail.post_message("bob", "hi alice", recipient="alice")
+
+    router = MessageRouter(config, db, SessionManager(config, db),
+                           None, None, None, None)
+    for name in ("alice", "bob", "carol"):
+        level, has_mail, room_name = await router._fetch_prompt_context(
+            name, SystemRoomIDs.LOBBY_ID)
+        user = User(db, name)
+        await user.load()
+        assert level == user.permission_level
+        assert bool(has_mail) == await mail.has_unread_messages(name)
+        assert room_name == "Lobby"
+
+
+@pytest.mark.asyncio
+async def test_refresh_for_login_caches_node(temp_db):
+    from citadel.transport.engines.meshcore.node_auth import NodeAuth
+
+    db, config = temp_db
+    auth = NodeAuth(config, db)
+    assert not await auth.node_has_password_cache("abc123")
+
+    await auth.refresh_for_login("alice", "abc123")
+    assert await auth.node_has_password_cache("abc123") == "alice"
+
+    # a second login from the same node replaces the username
+    await auth.refresh_for_login("bob", "abc123")
+    assert await auth.node_has_password_cache("abc123") == "bob"
+
+    # an entry older than password_cache_duration no longer counts
+    await db.execute(
+        "UPDATE mc_passwd_cache SET last_pw_use = ? WHERE node_id = ?",
+        ("2000-01-01 00:00:00", "abc123"))
+    assert not await auth.node_has_password_cache("abc123")
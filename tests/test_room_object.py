@@ -89,6 +89,7 @@ async def test_room_initialization(db, config, setup_rooms):
     assert room.name == "Lobby"
     assert room.next_neighbor == 2
     assert room.prev_neighbor is None
+    assert room.prompt_suffix == "In Lobby. What now? (H for help)"
 
 
 @pytest.mark.asyncio
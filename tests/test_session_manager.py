@@ -143,3 +143,33 @@ async def test_workflow_state_lifecycle(session_mgr):
     assert session_mgr.get_workflow("invalid") is None
     session_mgr.set_workflow("invalid", wf)  # should be a no-op
     session_mgr.clear_workflow("invalid")    # should be a no-op
+
+
+@pytest.mark.asyncio
+async def test_send_msgs_queues_each_message(session_mgr):
+    session_id = session_mgr.create_session("node1")
+
+    assert await session_mgr.send_msgs(session_id, ["one", "two", "three"]) == 3
+    state = session_mgr.get_session_state(session_id)
+    assert state.msg_queue.get_nowait().text == "one"
+
+    # each message is its own queue item, so they can still be cleared
+    assert await session_mgr.clear_msg_queue(session_id) == 2
+
+
+@pytest.mark.asyncio
+async def test_snapshot_for_node(session_mgr):
+    snap = session_mgr.snapshot_for_node("node1")
+    assert snap.is_new
+    assert snap.state.node_id == "node1"
+    assert snap.workflow is None
+
+    wf = WorkflowState(kind="login", step=1, data={})
+    session_mgr.set_workflow(snap.session_id, wf)
+    again = session_mgr.snapshot_for_node("node1")
+    assert not again.is_new
+    assert again.session_id == snap.session_id
+    assert again.workflow is wf
+
+    assert session_mgr.snapshot(snap.session_id).workflow is wf
+    assert session_mgr.snapshot("invalid") is None